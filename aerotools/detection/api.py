@@ -1,6 +1,9 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
 from fastapi.responses import JSONResponse
 from .service import Detector
+from .schemas import ToolClass
+from .ocr_cache import OcrCache
+from .ocr import OcrEngine
 from ultralytics import YOLO
 import logging
 import json
@@ -8,7 +11,6 @@ from ..model_manager import ModelManager
 from ..settings import settings
 from ..utils.file_helper import FileHelper
 from ..logger import PerformanceLogger
-import easyocr
 
 logger = logging.getLogger(__name__)
 
@@ -19,27 +21,43 @@ _model_manager = ModelManager(
     capacity=settings.lru_capacity,
     device=settings.device,
 )
-ocr = easyocr.Reader(["en"])
+# EasyOCR грузится при первом запросе с text_detection
+_ocr = OcrEngine(
+    languages=settings.ocr_languages,
+    batch_size=settings.ocr_batch_size,
+    use_process=settings.ocr_worker_process,
+)
+_ocr_cache = OcrCache(capacity=settings.ocr_cache_size)
 
 
-def get_classes():
+def get_classes() -> list[ToolClass]:
     with open("./toolsets/toolset-11.json", "r") as file:
         classes = json.load(file)
-    return classes
+    return ToolClass.parse_toolset(classes)
 
 
 def get_detector(classes = Depends(get_classes)) -> Detector:
-    return Detector(model_manager=_model_manager, classes=classes, ocr=ocr)
+    return Detector(model_manager=_model_manager, classes=classes, ocr=_ocr, ocr_cache=_ocr_cache)
 
 @router.on_event("startup")
 async def _warmup():
     await _model_manager.warmup()
 
 
+@router.on_event("shutdown")
+async def _shutdown():
+    _ocr.shutdown()
+
+
 @router.get(f"/models")
 def list_models():
     return {"available": list(settings.models.keys()), "device": _model_manager.device}
 
+
+@router.get(f"/ocr/stats")
+def ocr_stats():
+    return {**_ocr.stats(), "cache": _ocr_cache.stats()}
+
 @router.post(f"/detect")
 async def detect(
     img_file: UploadFile = File(...),
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 0 и 360 не нужны: EasyOCR всегда распознаёт исходное изображение в дополнение к поворотам
+OCR_ROTATIONS = [45, 90, 135, 180, 225, 270, 315]
+OCR_PARAMS = dict(
+    text_threshold=0.5,
+    link_threshold=0.6,
+    threshold=0.7,
+    detail=0,
+    paragraph=False,
+    allowlist='ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-',
+    min_size=10,
+    rotation_info=OCR_ROTATIONS,
+)
+
+
+def ocr_on_rois(reader, rois: List[np.ndarray], batch_size: int) -> List[List[str]]:
+    """
+    Распознаёт все ROI пачками: ROI близких размеров дополняются нулями до общего холста
+    и идут в один readtext_batched. Возвращает тексты для каждого ROI в исходном порядке.
+    """
+    texts: List[List[str]] = [[] for _ in rois]
+    valid = [i for i, roi in enumerate(rois) if roi is not None and roi.size > 0]
+    # сортировка по площади — меньше пустого места при дополнении
+    valid.sort(key=lambda i: rois[i].shape[0] * rois[i].shape[1])
+
+    for start in range(0, len(valid), batch_size):
+        group = valid[start:start + batch_size]
+        h = max(rois[i].shape[0] for i in group)
+        w = max(rois[i].shape[1] for i in group)
+        canvases = []
+        for i in group:
+            roi = rois[i]
+            canvas = np.zeros((h, w) + roi.shape[2:], dtype=roi.dtype)
+            canvas[:roi.shape[0], :roi.shape[1]] = roi
+            canvases.append(canvas)
+
+        batch_results = reader.readtext_batched(canvases, n_width=w, n_height=h,
+                                                batch_size=batch_size, **OCR_PARAMS)
+        for i, ocr_results in zip(group, batch_results):
+            for t in ocr_results:
+                if isinstance(t, str):
+                    t = t.strip()
+                    if t:
+                        texts[i].append(t)
+    return texts
+
+
+def _create_reader(languages: list[str]):
+    import easyocr
+
+    logger.info(f"Loading EasyOCR reader {languages}")
+    return easyocr.Reader(languages)
+
+
+# состояние отдельного OCR-процесса
+_worker_reader = None
+_worker_languages: list[str] = []
+
+
+def _worker_init(languages: list[str]):
+    global _worker_languages
+    _worker_languages = languages
+
+
+def _worker_recognize(rois: List[np.ndarray], batch_size: int) -> List[List[str]]:
+    global _worker_reader
+    if _worker_reader is None:
+        _worker_reader = _create_reader(_worker_languages)
+    return ocr_on_rois(_worker_reader, rois, batch_size)
+
+
+class OcrEngine:
+    """
+    EasyOCR с ленивой загрузкой: Reader создаётся при первом запросе с text_detection.
+    В режиме use_process распознавание идёт в отдельном процессе (очередь запросов —
+    очередь ProcessPoolExecutor) и не делит GIL и ядра с YOLO.
+    """
+
+    def __init__(self, languages: list[str], batch_size: int, use_process: bool = False):
+        self.languages = list(languages)
+        self.batch_size = batch_size
+        self.use_process = use_process
+
+        self._reader = None
+        self._reader_lock = threading.Lock()
+        self._pool: ProcessPoolExecutor | None = None
+        self._calls = 0
+
+    def _get_reader(self):
+        with self._reader_lock:
+            if self._reader is None:
+                self._reader = _create_reader(self.languages)
+            return self._reader
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            logger.info("Starting OCR worker process")
+            # spawn: fork процесса с загруженным torch/CUDA ненадёжен
+            self._pool = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+                initargs=(self.languages,),
+            )
+        return self._pool
+
+    async def recognize(self, rois: List[np.ndarray]) -> List[List[str]]:
+        if not rois:
+            return []
+        self._calls += 1
+
+        if not self.use_process:
+            return await asyncio.to_thread(lambda: ocr_on_rois(self._get_reader(), rois, self.batch_size))
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_pool(), _worker_recognize, rois, self.batch_size)
+        except BrokenProcessPool:
+            # процесс упал (например, OOM) — следующий запрос поднимет новый
+            logger.error("OCR worker process died, restarting on next request")
+            self._pool = None
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "mode": "process" if self.use_process else "thread",
+            "loaded": self._pool is not None if self.use_process else self._reader is not None,
+            "calls": self._calls,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
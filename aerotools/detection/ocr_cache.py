@@ -0,0 +1,44 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+class OcrCache:
+    """
+    LRU распознанных текстов по хэшу содержимого маскированного ROI:
+    повторно присланные наборы инструментов не проходят OCR заново.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data: "OrderedDict[bytes, list[str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(roi: np.ndarray) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(str(roi.shape).encode())
+        h.update(np.ascontiguousarray(roi).data)
+        return h.digest()
+
+    def get(self, key: bytes) -> list[str] | None:
+        texts = self._data.get(key)
+        if texts is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return texts
+
+    def put(self, key: bytes, texts: list[str]):
+        if self.capacity <= 0:
+            return
+        self._data[key] = texts
+        self._data.move_to_end(key)
+        while len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
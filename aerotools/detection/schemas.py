@@ -1,5 +1,6 @@
 from typing import TypedDict
 from dataclasses import dataclass
+from pydantic import BaseModel
 
 
 @dataclass(frozen=True)
@@ -25,4 +26,14 @@ class DetectionDict(TypedDict, total=False):
     class_name: str
     confidence: float
     bbox: list[float]
-    polygons: list[list[list[float]]]
\ No newline at end of file
+    polygons: list[list[list[float]]]
+
+
+class ToolClass(BaseModel):
+    """Класс из toolset-*.json: строка с именем или объект {"name": ..., "ocr": false}."""
+    name: str
+    ocr: bool = True
+
+    @classmethod
+    def parse_toolset(cls, raw: list) -> list["ToolClass"]:
+        return [cls(name=e) if isinstance(e, str) else cls.model_validate(e) for e in raw]
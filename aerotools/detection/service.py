@@ -1,47 +1,29 @@
 from typing import List, Dict, Tuple
 from ..utils.geometry import Point, GeometryHelper
 from ..utils.file_helper import FileHelper
-from .schemas import Box, DetectionDict
+from .schemas import Box, DetectionDict, ToolClass
+from .ocr_cache import OcrCache
+from .ocr import OcrEngine
 from ..model_manager import ModelManager
 import logging
 from collections import Counter
 from ..logger import PerformanceLogger
+from ..settings import settings
 
+import asyncio
 import numpy as np
-import easyocr
 
 logger = logging.getLogger(__name__)
 
 class Detector:
-    def __init__(self, model_manager: ModelManager, ocr, classes):
+    def __init__(self, model_manager: ModelManager, ocr: OcrEngine, classes: list[ToolClass],
+                 ocr_cache: OcrCache | None = None):
         self.model_manager = model_manager
-        self.classes = classes
-        self._ocr_reader = ocr
-
-    @staticmethod
-    def _ocr_on_rois(reader: easyocr.Reader, rois: List[np.ndarray]) -> List[str]:
-        texts: List[str] = []
-        for roi in rois:
-            if roi is None or roi.size == 0:
-                continue
-        for roi in rois:
-            ocr_results = reader.readtext(
-                roi,
-                text_threshold=0.5,
-                link_threshold=0.6,
-                threshold=0.7,
-                detail=0,
-                paragraph=False,
-                allowlist='ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-',
-                min_size=10,
-                rotation_info = [0, 45, 90, 135, 180, 225, 270, 315, 360]
-            )
-            for t in ocr_results:
-                if isinstance(t, str):
-                    t = t.strip()
-                    if t:
-                        texts.append(t)
-        return texts
+        self.classes = [c.name for c in classes]
+        # OCR только для классов, на которых бывает гравировка номера
+        self.ocr_class_ids = {i for i, c in enumerate(classes) if c.ocr}
+        self._ocr = ocr
+        self._ocr_cache = ocr_cache
 
     @staticmethod
     def _pick_best_id(texts: List[str], min_len: int = 5) -> str:
@@ -85,43 +67,88 @@ class Detector:
         if not images:
             return []
 
+        # OCR режет ROI из кадра — ему нужно полное разрешение
+        target = settings.inference_imgsz if settings.decode_reduced and not text_detection else None
         with PerformanceLogger(logger=logger, message="Image preprocessing"):
             np_imgs, sizes = [], []
             for b in images:
-                np_img = FileHelper.bytes_to_numpy(image_bytes=b)
-                h, w = np_img.shape[:2]
+                np_img, (w, h), scale = FileHelper.decode_for_inference(image_bytes=b, target_size=target)
                 np_imgs.append(np_img)
-                sizes.append((w, h))
+                # координаты модели — в пикселях уменьшенного кадра, исходный размер переводим в те же единицы
+                sizes.append((w / scale, h / scale))
 
         model = await self.model_manager.get(model_name)
 
         out: list[dict] = []
-        n = len(np_imgs)
-        for i in range(0, n, batch_size):
-            chunk = np_imgs[i:i + batch_size]
-
-            results = model.predict(
-                chunk,
-                imgsz=1280,
-                batch=min(batch_size, len(chunk)),
-                verbose=False,
-            )
-
-            for j, r in enumerate(results):
-                idx = i + j
-                img_w, img_h = sizes[idx]
-                np_img = np_imgs[idx]
-                out.append(self._build_result_for_frame(
-                    model_result=r,
-                    np_img=np_img,
-                    img_w=img_w,
-                    img_h=img_h,
-                    include_polygons=include_polygons,
-                    text_detection=text_detection
-                ))
+        # OCR чанка идёт параллельно с инференсом следующих чанков
+        ocr_tasks: list[asyncio.Task] = []
+        try:
+            n = len(np_imgs)
+            for i in range(0, n, batch_size):
+                chunk = np_imgs[i:i + batch_size]
+
+                with PerformanceLogger(logger=logger, message="Inference"):
+                    results = model.predict(
+                        chunk,
+                        imgsz=settings.inference_imgsz,
+                        batch=min(batch_size, len(chunk)),
+                        verbose=False,
+                    )
+
+                # ROI всех детекций всего чанка собираются и распознаются одним проходом OCR
+                ocr_jobs: list[tuple[DetectionDict, list[np.ndarray]]] = []
+                with PerformanceLogger(logger=logger, message="Postprocess"):
+                    for j, r in enumerate(results):
+                        idx = i + j
+                        img_w, img_h = sizes[idx]
+                        np_img = np_imgs[idx]
+                        out.append(self._build_result_for_frame(
+                            model_result=r,
+                            np_img=np_img,
+                            img_w=img_w,
+                            img_h=img_h,
+                            include_polygons=include_polygons,
+                            text_detection=text_detection,
+                            ocr_jobs=ocr_jobs,
+                        ))
+
+                if ocr_jobs:
+                    ocr_tasks.append(asyncio.create_task(self._run_ocr(ocr_jobs)))
+                    # даём задаче дойти до отправки ROI в поток/процесс OCR до следующего predict
+                    await asyncio.sleep(0)
+
+            await asyncio.gather(*ocr_tasks)
+        finally:
+            for t in ocr_tasks:
+                t.cancel()
 
         return out
 
+    async def _run_ocr(self, ocr_jobs: list[tuple[DetectionDict, list[np.ndarray]]]):
+        rois = [roi for _, det_rois in ocr_jobs for roi in det_rois]
+        texts: List[List[str] | None] = [None] * len(rois)
+
+        keys: list[bytes] = []
+        if self._ocr_cache is not None:
+            keys = [OcrCache.key(roi) for roi in rois]
+            texts = [self._ocr_cache.get(k) for k in keys]
+
+        missing = [i for i, t in enumerate(texts) if t is None]
+        logger.debug(f"OCR cache: {len(rois) - len(missing)} hits, {len(missing)} misses")
+        if missing:
+            with PerformanceLogger(logger=logger, message=f"OCR ({len(missing)} ROI)"):
+                recognized = await self._ocr.recognize([rois[i] for i in missing])
+            for i, roi_texts in zip(missing, recognized):
+                texts[i] = roi_texts
+                if keys:
+                    self._ocr_cache.put(keys[i], roi_texts)
+
+        pos = 0
+        for det, det_rois in ocr_jobs:
+            raw_texts = [t for roi_texts in texts[pos:pos + len(det_rois)] for t in roi_texts]
+            pos += len(det_rois)
+            det["ocr"] = self._pick_best_id(raw_texts, min_len=5)
+
     def _build_result_for_frame(
             self,
             model_result,
@@ -129,7 +156,8 @@ class Detector:
             img_w: int,
             img_h: int,
             include_polygons: bool,
-            text_detection: bool
+            text_detection: bool,
+            ocr_jobs: list[tuple[DetectionDict, list[np.ndarray]]] | None = None,
     ) -> Dict:
         boxes = getattr(model_result, "boxes", None)
         masks = getattr(model_result, "masks", None)
@@ -171,7 +199,7 @@ class Detector:
                         if polys:
                             det["polygons"] = polys
 
-                    if text_detection:
+                    if text_detection and cls_id in self.ocr_class_ids:
                         pixel_polys: List[np.ndarray] = []
                         for arr in contours:
                             if isinstance(arr, np.ndarray):
@@ -180,12 +208,10 @@ class Detector:
                                 pixel_polys.append(np.array(arr, dtype=np.float32)[:, :2])
 
                         rois = GeometryHelper.polygon_mask_and_crop(np_img, pixel_polys)
-                        id_text = ""
-                        if rois:
-                            raw_texts = self._ocr_on_rois(self._ocr_reader, rois)
-                            id_text = self._pick_best_id(raw_texts, min_len=5)
-
-                        det["ocr"] = id_text
+                        # распознаётся позже, пачкой по всему чанку — см. _run_ocr
+                        det["ocr"] = ""
+                        if rois and ocr_jobs is not None:
+                            ocr_jobs.append((det, rois))
 
                 detections.append(det)
                 class_ids_for_counter.append(cls_id)
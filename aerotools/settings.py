@@ -14,10 +14,21 @@ class AppSettings(BaseSettings):
     lru_capacity: int = 3
     warmup_models: list[str] = Field(default=["main"])
 
+    # без OCR JPEG декодируется сразу близко к размеру инференса (DCT-scaling)
+    decode_reduced: bool = True
+    inference_imgsz: int = 1280
+
     batch_max_files: int = 500
     batch_max_archive_mb: int = 512
     batch_allow_exts: tuple[str, ...] = (".jpg", ".jpeg", ".png")
 
+    # сколько ROI распознаётся за один вызов EasyOCR (ROI дополняются до общего размера)
+    ocr_batch_size: int = 8
+    ocr_cache_size: int = 2048
+    ocr_languages: list[str] = Field(default=["en"])
+    # EasyOCR в отдельном процессе: не конкурирует с YOLO за GIL
+    ocr_worker_process: bool = False
+
     class Config:
         env_prefix = "APP_"
         env_file = ".env"
@@ -3,6 +3,7 @@ import asyncio
 from typing import Iterable
 import cv2
 import numpy as np
+from PIL import Image
 from ..settings import settings
 
 class FileHelper:
@@ -12,13 +13,35 @@ class FileHelper:
     def is_allowed_name(cls, name: str) -> bool:
         return name.lower().endswith(cls.ALLOWED_EXTENSIONS)
 
-    @staticmethod
-    def bytes_to_numpy(image_bytes: bytes) -> np.ndarray:
-        np_img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    # масштаб -> флаг libjpeg DCT-scaling в OpenCV
+    _REDUCED_FLAGS = {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2}
+
+    @classmethod
+    def decode_for_inference(cls, image_bytes: bytes, target_size: int | None = None) -> tuple[np.ndarray, tuple[int, int], int]:
+        """
+        RGB-массив, исходные (w, h) с учётом EXIF-поворота и масштаб уменьшения (1, 2, 4 или 8).
+        JPEG декодируется сразу уменьшенным (IMREAD_REDUCED_*), длинная сторона остаётся не меньше target_size.
+        """
+        # PIL читает только заголовок — размер известен до декодирования
+        try:
+            header = Image.open(io.BytesIO(image_bytes))
+        except OSError as e:
+            raise ValueError("Invalid image data") from e
+        w, h = header.size
+        scale = 1
+        if target_size and header.format == "JPEG":
+            scale = next((s for s in cls._REDUCED_FLAGS if max(w, h) >= s * target_size), 1)
+
+        flag = cls._REDUCED_FLAGS.get(scale, cv2.IMREAD_COLOR)
+        np_img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flag)
         if np_img is None:
             raise ValueError("Invalid image data")
+        # заголовок PIL не учитывает EXIF Orientation, а imdecode поворачивает пиксели (5-8 — на 90°)
+        dec_h, dec_w = np_img.shape[:2]
+        if abs(dec_w * scale - h) + abs(dec_h * scale - w) < abs(dec_w * scale - w) + abs(dec_h * scale - h):
+            w, h = h, w
         np_img = cv2.cvtColor(np_img, cv2.COLOR_BGR2RGB)
-        return np_img
+        return np_img, (w, h), scale
 
     @classmethod
     async def read_archive_images(cls, archive_bytes: bytes) -> Iterable[tuple[str, bytes]]:
@@ -57,8 +57,14 @@ class GeometryHelper:
 
     @staticmethod
     def polygon_mask_and_crop(np_img: np.ndarray, polygons: list[np.ndarray]) -> list[np.ndarray]:
+        """
+        Вырезает ROI по полигонам, обнуляя пиксели вне полигона.
+        Маска строится только в пределах boundingRect (полигон сдвигается в начало координат кропа),
+        один буфер маски переиспользуется для всех полигонов.
+        """
         h, w = np_img.shape[:2]
         rois: list[np.ndarray] = []
+        mask_buf: np.ndarray | None = None
 
         for poly in polygons:
             if poly is None or len(poly) < 3:
@@ -66,20 +72,22 @@ class GeometryHelper:
 
             poly_int = np.round(np.asarray(poly, dtype=np.float32)).astype(np.int32)  # (N,2)
 
-            mask = np.zeros((h, w), dtype=np.uint8)
-            cv2.fillPoly(mask, [poly_int], 255)
-
-            masked = cv2.bitwise_and(np_img, np_img, mask=mask)
-
             x, y, bw, bh = cv2.boundingRect(poly_int)
-            x2, y2 = x + bw, y + bh
-            x = max(0, x);
-            y = max(0, y)
-            x2 = min(w, x2);
-            y2 = min(h, y2)
+            x1, y1 = max(0, x), max(0, y)
+            x2, y2 = min(w, x + bw), min(h, y + bh)
+            if x2 <= x1 or y2 <= y1:
+                continue
+            ch, cw = y2 - y1, x2 - x1
+
+            if mask_buf is None or mask_buf.shape[0] < ch or mask_buf.shape[1] < cw:
+                buf_h = max(ch, mask_buf.shape[0] if mask_buf is not None else 0)
+                buf_w = max(cw, mask_buf.shape[1] if mask_buf is not None else 0)
+                mask_buf = np.empty((buf_h, buf_w), dtype=np.uint8)
+            mask = mask_buf[:ch, :cw]
+            mask.fill(0)
+            cv2.fillPoly(mask, [poly_int - np.array([x1, y1], dtype=np.int32)], 255)
 
-            roi = masked[y:y2, x:x2]
-            if roi.size > 0:
-                rois.append(roi)
+            crop = np_img[y1:y2, x1:x2]
+            rois.append(cv2.bitwise_and(crop, crop, mask=mask))
 
-        return rois
\ No newline at end of file
+        return rois
@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .detection.api import router
+from .jobs.api import router as jobs_router
 from .logger import setup_package_logger
 
 
@@ -8,6 +9,7 @@ def start_app() -> FastAPI:
     setup_package_logger()
     app = FastAPI()
     app.include_router(router)
+    app.include_router(jobs_router)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
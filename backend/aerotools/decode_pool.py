@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Literal
+
+import numpy as np
+
+from .utils.file_helper import FileHelper
+
+logger = logging.getLogger(__name__)
+
+Decoded = tuple[np.ndarray, tuple[int, int], int]
+
+
+class _ShmFrame:
+    """Кадр, оставленный воркером в shared memory: по pipe идут только имя сегмента и форма."""
+
+    __slots__ = ("name", "shape", "dtype")
+
+    def __init__(self, name: str, shape: tuple[int, ...], dtype: str):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+
+def _decode_to_shm(image_bytes: bytes, target_size: int | None) -> tuple[np.ndarray | _ShmFrame, tuple[int, int], int]:
+    # выполняется в процессе-воркере
+    np_img, size, scale = FileHelper.decode_for_inference(image_bytes, target_size=target_size)
+    try:
+        shm = shared_memory.SharedMemory(create=True, size=np_img.nbytes)
+    except OSError:
+        # /dev/shm переполнен (в docker по умолчанию 64 МБ) — отдаём обычным pickle
+        return np_img, size, scale
+    try:
+        np.ndarray(np_img.shape, dtype=np_img.dtype, buffer=shm.buf)[:] = np_img
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()
+    return _ShmFrame(shm.name, np_img.shape, np_img.dtype.str), size, scale
+
+
+def _attach(frame: _ShmFrame) -> np.ndarray:
+    # одна копия в память процесса — сегмент сразу освобождается и не живёт дольше запроса
+    shm = shared_memory.SharedMemory(name=frame.name)
+    try:
+        return np.ndarray(frame.shape, dtype=np.dtype(frame.dtype), buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+class DecodePool:
+    """
+    Параллельное декодирование изображений вне event loop.
+    thread — пул потоков (PIL отпускает GIL на время декодирования),
+    process — пул процессов, RGB-массив возвращается через shared memory, а не pickle.
+    workers=0 — как раньше: кадры чанка декодируются по очереди в одном потоке.
+    """
+
+    def __init__(self, workers: int, mode: Literal["thread", "process"] = "thread"):
+        self.workers = max(0, workers)
+        self.mode = mode
+        self._pool: Executor | None = None
+        self._pool_lock = threading.Lock()
+        self._decoded = 0
+
+    def _get_pool(self) -> Executor:
+        with self._pool_lock:
+            if self._pool is None:
+                if self.mode == "process":
+                    logger.info(f"Starting {self.workers} decode worker processes")
+                    # spawn: fork процесса с загруженным torch ненадёжен
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="decode")
+            return self._pool
+
+    async def decode(self, image_bytes: bytes, target_size: int | None) -> Decoded:
+        return (await self.decode_many([image_bytes], target_size))[0]
+
+    async def decode_many(self, blobs: list[bytes], target_size: int | None) -> list[Decoded]:
+        """
+        (RGB-массив, исходные (w, h), масштаб) для каждого изображения в исходном порядке.
+        """
+        if not blobs:
+            return []
+        if self.workers == 0:
+            decoded = await asyncio.to_thread(
+                lambda: [FileHelper.decode_for_inference(b, target_size=target_size) for b in blobs])
+            self._decoded += len(decoded)
+            return decoded
+
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        fn = _decode_to_shm if self.mode == "process" else FileHelper.decode_for_inference
+        futures = [loop.run_in_executor(pool, fn, b, target_size) for b in blobs]
+        try:
+            decoded = await asyncio.gather(*futures)
+        except BrokenProcessPool:
+            # воркер упал (например, OOM) — следующий вызов поднимет новый пул
+            logger.error("Decode worker process died, restarting on next request")
+            with self._pool_lock:
+                if self._pool is pool:
+                    self._pool = None
+            raise
+        except BaseException:
+            # при ошибке одного кадра остальные сегменты shared memory не должны утечь
+            for f in futures:
+                f.add_done_callback(self._discard)
+            raise
+
+        self._decoded += len(decoded)
+        if self.mode != "process":
+            return decoded
+        return [(_attach(img) if isinstance(img, _ShmFrame) else img, size, scale)
+                for img, size, scale in decoded]
+
+    @staticmethod
+    def _discard(future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        img = future.result()[0]
+        if isinstance(img, _ShmFrame):
+            _attach(img)
+
+    def stats(self) -> dict:
+        return {
+            "mode": "inline" if self.workers == 0 else self.mode,
+            "workers": self.workers,
+            "started": self._pool is not None,
+            "decoded": self._decoded,
+        }
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
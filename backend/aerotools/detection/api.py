@@ -1,152 +1,512 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from pydantic import BaseModel, ValidationError
+from starlette.background import BackgroundTask
 from .service import Detector
+from .schemas import ClassFilter, BatchForm
+from .toolsets import ToolsetRegistry, Toolset
+from .batching import MicroBatcher
+from .cache import ResultCache
 from ultralytics import YOLO
+import asyncio
+import itertools
 import logging
 import json
+import secrets
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable
 from ..model_manager import ModelManager
+from ..inference_executor import InferenceExecutor, InferenceQueueFull
+from ..decode_pool import DecodePool
 from ..settings import settings
 from ..utils.file_helper import FileHelper
-from ..logger import PerformanceLogger
+from ..utils.multipart_stream import MultipartStream, StreamPart, UploadTooLarge, MalformedUpload
+from ..logger import PerformanceLogger, span
+from ..metrics import metrics, MetricFamily, STAGE_SECONDS
+from ..profiling import RequestTimings, ProfileCapture, ProfileBusy, collect_timings, bind_timings
+from ..utils.memory import MemoryHelper
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+_executor = InferenceExecutor(
+    workers=settings.inference_workers,
+    queue_size=settings.inference_queue_size,
+)
 _model_manager = ModelManager(
     registry=settings.models,
     capacity=settings.lru_capacity,
     device=settings.device,
+    executor=_executor,
+    memory_budget_mb=settings.model_memory_budget_mb,
+)
+_batcher = MicroBatcher(
+    model_manager=_model_manager,
+    executor=_executor,
+    max_batch=settings.microbatch_max_size,
+    max_wait_ms=settings.microbatch_max_wait_ms,
 )
+_decoder = DecodePool(workers=settings.decode_workers, mode=settings.decode_mode)
+_result_cache = ResultCache(
+    max_mb=settings.result_cache_mb,
+    disk_dir=settings.result_cache_dir,
+    disk_max_mb=settings.result_cache_disk_mb,
+) if settings.result_cache_mb > 0 or settings.result_cache_dir else None
+
+
+_toolsets = ToolsetRegistry(directory=settings.toolsets_dir, default=settings.default_toolset)
+
+
+def _collect_metrics() -> list[MetricFamily]:
+    inference = _executor.stats()
+    models = _model_manager.stats()["models"]
+    families: list[MetricFamily] = [
+        ("aerotools_inference_queue_depth", "gauge", "Predict calls waiting for an inference worker",
+         [({}, inference["queue_depth"])]),
+        ("aerotools_inference_running", "gauge", "Predict calls in progress", [({}, inference["running"])]),
+        ("aerotools_inference_calls_total", "counter", "Finished or rejected predict calls",
+         [({"status": s}, inference[s]) for s in ("completed", "failed", "rejected")]),
+        ("aerotools_decoded_images_total", "counter", "Images decoded by DecodePool", [({}, _decoder.stats()["decoded"])]),
+        ("aerotools_model_loaded", "gauge", "Model is resident in the LRU cache",
+         [({"model": n}, int(m["loaded"])) for n, m in models.items()]),
+        ("aerotools_model_cache_hits_total", "counter", "ModelManager.get served from cache",
+         [({"model": n}, m["hits"]) for n, m in models.items()]),
+        ("aerotools_model_loads_total", "counter", "Model loads from disk", [({"model": n}, m["loads"]) for n, m in models.items()]),
+        ("aerotools_model_evictions_total", "counter", "Models evicted from the LRU cache",
+         [({"model": n}, m["evictions"]) for n, m in models.items()]),
+        ("process_resident_memory_bytes", "gauge", "Resident memory size in bytes",
+         [({}, MemoryHelper.process_rss_bytes())]),
+    ]
+    if _result_cache is not None:
+        cache = _result_cache.stats()
+        families.append(("aerotools_result_cache_lookups_total", "counter", "Result cache lookups",
+                         [({"result": "hit"}, cache["hits"] - cache["disk_hits"]),
+                          ({"result": "disk_hit"}, cache["disk_hits"]),
+                          ({"result": "miss"}, cache["misses"])]))
+    return families
+
+
+metrics.collector(_collect_metrics)
+
+
+def get_toolset(
+    toolset: str | None = Form(default=None, description=f"toolsets/<name>.json, default {settings.default_toolset}"),
+) -> Toolset:
+    try:
+        return _toolsets.get(toolset)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+def _ndjson_line(obj: dict) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _ndjson_response(results, names: list[str], summary: dict,
+                     background: BackgroundTask | None = None,
+                     timings: RequestTimings | None = None) -> StreamingResponse:
+    """
+    Одна строка JSON на изображение по мере готовности чанков, последней строкой — summary.
+    """
+    async def lines():
+        if timings is not None:
+            # результаты считаются уже здесь, в задаче ответа, а не в эндпоинте
+            bind_timings(timings)
+        processed = 0
+        errors = []
+        # сериализация размазана по строкам — в гистограмму идёт сумма за ответ
+        serialize = 0.0
+        try:
+            async for idx, res in results:
+                processed += 1
+                with PerformanceLogger() as t:
+                    line = _ndjson_line({"type": "item", "filename": names[idx], **res})
+                serialize += t.elapsed
+                yield line
+        except Exception as e:
+            logger.exception("Streaming inference failed")
+            errors.append(f"Batch inference failed: {e}")
+            yield _ndjson_line({"type": "error", "detail": errors[-1]})
+        STAGE_SECONDS.observe(serialize, "serialize", summary["model"])
+        tail = {"type": "summary", **summary, "processed": processed, "errors": errors}
+        if timings is not None:
+            timings.add("serialize", serialize)
+            tail["timings"] = timings.as_dict()
+        yield _ndjson_line(tail)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", background=background)
+
+
+def _json_response(payload: dict, model_name: str, timings: RequestTimings | None) -> Response:
+    with span("serialize", model_name):
+        response = JSONResponse(payload)
+    if timings is None:
+        return response
+    # payload рендерится один раз; timings (уже с serialize) дописываются последним ключом в готовое тело
+    tail = response.render({"timings": timings.as_dict()})
+    body = response.body[:-1] + (b"," if len(response.body) > 2 else b"") + tail[1:]
+    return Response(content=body, media_type=response.media_type)
+
+
+def _request_profile(profile: bool, request: Request, name: str, stream: bool = False,
+                     started: float | None = None) -> tuple[RequestTimings | None, ProfileCapture | nullcontext]:
+    """
+    profile=true — timings в ответе; с верным X-Admin-Token ещё и дамп cProfile в settings.profile_dir.
+    started — начало запроса, если поле profile стало известно только после части загрузки.
+    """
+    if not profile:
+        return None, nullcontext()
+    timings = RequestTimings(started)
+    if started is not None:
+        timings.add("read", time.perf_counter() - started)
+    token = request.headers.get("x-admin-token")
+    if token is None:
+        return timings, nullcontext()
+    if not settings.admin_token or not secrets.compare_digest(token, settings.admin_token):
+        raise HTTPException(403, "Invalid admin token")
+    if stream:
+        raise HTTPException(400, "Profile dumps are not supported with stream=true")
+    return timings, ProfileCapture(settings.profile_dir, name, timings)
+
 
+@contextmanager
+def _profiled(timings: RequestTimings | None, capture: ProfileCapture | nullcontext):
+    try:
+        with capture, collect_timings(timings):
+            yield
+    except ProfileBusy as e:
+        raise HTTPException(409, str(e))
+
+
+def get_detector(toolset: Toolset = Depends(get_toolset)) -> Detector:
+    return Detector(model_manager=_model_manager, executor=_executor, batcher=_batcher,
+                    decoder=_decoder, toolset=toolset, cache=_result_cache)
+
+
+async def check_model(detector: Detector, model_name: str):
+    """Отклоняет неизвестную модель и toolset, классы которого модель не знает, — до обработки изображений."""
+    try:
+        await detector.bind_model(model_name)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+def get_class_filter(
+    conf: str | None = Form(default=None, description='JSON {"class name": threshold}, overrides toolset'),
+    classes: str | None = Form(default=None, description='JSON ["class name", ...] — detect only these'),
+    detector: Detector = Depends(get_detector),
+) -> ClassFilter:
+    return _parse_class_filter(detector, conf, classes)
+
+
+def _parse_class_filter(detector: Detector, conf: str | None, classes: str | None) -> ClassFilter:
+    try:
+        conf_map = json.loads(conf) if conf else None
+        class_list = json.loads(classes) if classes else None
+        if conf_map is not None and not (isinstance(conf_map, dict)
+                                         and all(isinstance(v, (int, float)) and 0 <= v <= 1 for v in conf_map.values())):
+            raise ValueError("conf must be a JSON object of thresholds in [0, 1]")
+        if class_list is not None and not (isinstance(class_list, list) and all(isinstance(n, str) for n in class_list)):
+            raise ValueError("classes must be a JSON list of class names")
+        return detector.make_class_filter(conf=conf_map, classes=class_list)
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid class filter: {e}")
 
-def get_classes():
-    with open("./toolsets/toolset-11.json", "r") as file:
-        classes = json.load(file)
-    return classes
 
+def _multipart_openapi(form: type[BaseModel], file_field: str, many: bool) -> dict:
+    """Схема тела для OpenAPI: эндпоинты читают multipart сами, FastAPI её не выводит."""
+    schema = form.model_json_schema()
+    binary = {"type": "string", "format": "binary"}
+    schema["properties"] = {file_field: {"type": "array", "items": binary} if many else binary, **schema["properties"]}
+    schema["required"] = [file_field]
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": schema}}}}
+
+
+def _upload_error(e: Exception) -> HTTPException:
+    return HTTPException(413 if isinstance(e, UploadTooLarge) else 400, str(e))
+
+
+def _stream_form(fields: dict[str, str]) -> tuple[BatchForm, Detector, ClassFilter]:
+    try:
+        form = BatchForm.model_validate(fields)
+    except ValidationError as e:
+        raise HTTPException(422, e.errors(include_url=False, include_context=False))
+    detector = get_detector(get_toolset(form.toolset))
+    return form, detector, _parse_class_filter(detector, form.conf, form.classes)
+
+_background_tasks: set[asyncio.Task] = set()
 
-def get_detector(classes = Depends(get_classes)) -> Detector:
-    return Detector(model_manager=_model_manager, classes=classes)
 
 @router.on_event("startup")
 async def _warmup():
-    await _model_manager.warmup()
+    # не блокируем старт: сервер принимает соединения, /ready отвечает 503 до конца прогрева
+    task = asyncio.create_task(_model_manager.warmup())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@router.on_event("shutdown")
+async def _shutdown():
+    _executor.shutdown()
+    _decoder.shutdown()
 
 
 @router.get(f"/models")
 def list_models():
     return {"available": list(settings.models.keys()), "device": _model_manager.device}
 
+
+@router.get(f"/toolsets")
+def list_toolsets():
+    toolsets = []
+    for name in _toolsets.available():
+        try:
+            toolsets.append(_toolsets.get(name).as_dict())
+        except ValueError as e:
+            toolsets.append({"name": name, "error": str(e)})
+    return {"default": settings.default_toolset, "toolsets": toolsets}
+
+
+@router.get(f"/ready")
+def ready():
+    state = _model_manager.readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
+@router.get(f"/models/stats")
+def model_stats():
+    return _model_manager.stats()
+
+
+@router.get(f"/inference/stats")
+def inference_stats():
+    return {**_executor.stats(), "batching": _batcher.stats(), "decode": _decoder.stats()}
+
+
+@router.get(f"/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get(f"/cache/stats")
+def cache_stats():
+    return _result_cache.stats() if _result_cache is not None else {"enabled": False}
+
 @router.post(f"/detect")
 async def detect(
+    request: Request,
     img_file: UploadFile = File(...),
     model_name: str = Form(default="default"),
     imgsz: int = Form(default=640),
+    simplify_epsilon: float = Form(default=0.0, ge=0, description="RDP epsilon in pixels, 0 = raw contours"),
+    profile: bool = Form(default=False, description="attach per-stage timings (ms) to the response"),
     detector: Detector = Depends(get_detector),
+    class_filter: ClassFilter = Depends(get_class_filter),
 ):
     logging.info(f"/detect({img_file.filename=}, {model_name=})")
     if not FileHelper.is_allowed_name(name=img_file.filename):
         raise HTTPException(status_code=415, detail=f"Only {FileHelper.ALLOWED_EXTENSIONS} supported got {img_file.filename}")
-    img_bytes = await img_file.read()
-    with PerformanceLogger(logger=logger, message="Single detect took"):
-        try:
-            result = await detector.detect(image_bytes=img_bytes,
-                                           model_name=model_name,
-                                           imgsz=imgsz)
-        except Exception as e:
-            raise HTTPException(400, f"Inference failed: {e}")
-    return JSONResponse(result)
+    timings, capture = _request_profile(profile, request, "detect")
+    with _profiled(timings, capture):
+        with span("read", model_name):
+            img_bytes = await img_file.read()
+        with PerformanceLogger(logger=logger, message="Single detect", stage="request_detect", model=model_name):
+            try:
+                result = await detector.detect(image_bytes=img_bytes,
+                                               model_name=model_name,
+                                               imgsz=imgsz,
+                                               simplify_epsilon=simplify_epsilon,
+                                               class_filter=class_filter)
+            except InferenceQueueFull as e:
+                raise HTTPException(503, str(e))
+            except Exception as e:
+                raise HTTPException(400, f"Inference failed: {e}")
+        return _json_response(result, model_name, timings)
 
 
-@router.post(f"/detect/batch")
-async def detect_batch(
-    files: list[UploadFile] = File(..., description="files[] = jpg/png"),
-    model_name: str = Form(default="default"),
-    bs: int = Form(8),
-    imgsz: int = Form(640),
-    detector: Detector = Depends(get_detector),
-):
-    logging.info(f"/detect({model_name=})")
-    if not files:
+@router.post(f"/detect/batch", openapi_extra=_multipart_openapi(BatchForm, "files", many=True))
+async def detect_batch(request: Request):
+    """
+    files[] = jpg/png. Поля формы — в любом порядке относительно файлов.
+    Тело читается потоком, лимиты проверяются до конца загрузки; загрузка дочитывается здесь же, до ответа.
+    """
+    started = time.perf_counter()
+    mb = 1024 * 1024
+    try:
+        upload = MultipartStream(request,
+                                 max_total_bytes=settings.batch_max_upload_mb * mb,
+                                 max_file_bytes=settings.batch_max_image_mb * mb,
+                                 max_files=settings.batch_max_files,
+                                 new_file=lambda: tempfile.SpooledTemporaryFile(max_size=1024 * 1024))
+        # тело — только в задаче эндпоинта: StreamingResponse параллельно слушает disconnect через тот же
+        # receive() и забрал бы себе чанки тела, а потерянные изображения не попали бы ни в items, ни в errors
+        parts = await upload.read_all()
+    except (UploadTooLarge, MalformedUpload) as e:
+        raise _upload_error(e)
+    if not parts:
         raise HTTPException(400, "No files provided")
-    if len(files) > settings.batch_max_files:
-        raise HTTPException(413, f"Too many files (>{settings.batch_max_files})")
 
-    _ = await _model_manager.get(model_name)
+    def close_parts():
+        for part in parts:
+            part.file.close()
 
-    names, blobs = [], []
-    for f in files:
-        if not FileHelper.is_allowed_name(name=f.filename):
-            raise HTTPException(status_code=415, detail=f"Only {FileHelper.ALLOWED_EXTENSIONS} supported got {f.filename}")
-        names.append(f.filename)
-        blobs.append(await f.read())
+    try:
+        return await _detect_batch(request, parts, upload.fields, started, close_parts)
+    except BaseException:
+        close_parts()
+        raise
 
-    with PerformanceLogger(logger=logger, message="Batch detect took"):
-        try:
-            results = await detector.detect_many(
-                images=blobs,
-                model_name=model_name,
-                batch_size=bs,
-                imgsz=imgsz
 
-            )
-        except Exception as e:
-            raise HTTPException(500, f"Batch inference failed: {e}")
+async def _detect_batch(request: Request, parts: list[StreamPart], fields: dict[str, str], started: float,
+                        close_parts: Callable[[], None]):
+    form, detector, class_filter = _stream_form(fields)
+    model_name, bs, imgsz = form.model_name, form.bs, form.imgsz
+    logging.info(f"/detect({model_name=})")
+    timings, capture = _request_profile(form.profile, request, "detect_batch", stream=form.stream, started=started)
+    for part in parts:
+        if not FileHelper.is_allowed_name(name=part.filename):
+            raise HTTPException(status_code=415, detail=f"Only {FileHelper.ALLOWED_EXTENSIONS} supported got {part.filename}")
 
-    items = [{"filename": n, **r} for n, r in zip(names, results)]
-    return JSONResponse({
-        "items": items,
-        "errors": [],
-        "summary": {"input_files": len(files), "processed": len(items), "model": model_name, "batch": bs}
-    })
+    await check_model(detector, model_name)
 
+    names = [part.filename for part in parts]
+    summary = {"input_files": len(parts), "model": model_name, "batch": bs}
 
-@router.post(f"/detect/archive")
-async def detect_archive(
-    archive: UploadFile = File(..., description="ZIP or TAR archive"),
-    model_name: str = Form(default="default"),
-    bs: int = Form(8, description="batch size"),
-    imgsz: int = Form(640, description="inference size"),
-    detector: Detector = Depends(get_detector),
-):
-    logging.info(f"/detect({model_name=})")
-    raw = await archive.read()
+    def blobs():
+        for part in parts:
+            yield part.read()
+
+    if form.stream:
+        return _ndjson_response(
+            detector.iter_detect_many(images=blobs(), model_name=model_name, batch_size=bs, imgsz=imgsz,
+                                      class_filter=class_filter),
+            names=names,
+            summary=summary,
+            background=BackgroundTask(close_parts),
+            timings=timings,
+        )
+
+    with _profiled(timings, capture):
+        with PerformanceLogger(logger=logger, message="Batch detect", stage="request_batch", model=model_name):
+            try:
+                results = await detector.detect_many(
+                    images=blobs(),
+                    model_name=model_name,
+                    batch_size=bs,
+                    imgsz=imgsz,
+                    class_filter=class_filter,
+                )
+            except InferenceQueueFull as e:
+                raise HTTPException(503, str(e))
+            except Exception as e:
+                raise HTTPException(500, f"Batch inference failed: {e}")
+            finally:
+                close_parts()
+
+        items = [{"filename": n, **r} for n, r in zip(names, results)]
+        return _json_response({
+            "items": items,
+            "errors": [],
+            "summary": {**summary, "processed": len(items)}
+        }, model_name, timings)
+
+
+@router.post(f"/detect/archive", openapi_extra=_multipart_openapi(BatchForm, "archive", many=False))
+async def detect_archive(request: Request):
+    """
+    ZIP or TAR archive. Архив пишется во временный файл по мере прихода,
+    превышение batch_max_archive_mb обрывает загрузку сразу.
+    """
+    started = time.perf_counter()
     max_bytes = settings.batch_max_archive_mb * 1024 * 1024
-    if len(raw) > max_bytes:
+    upload = None
+    try:
+        upload = MultipartStream(request,
+                                 max_total_bytes=max_bytes + MultipartStream.MAX_FIELD_BYTES,
+                                 max_file_bytes=max_bytes,
+                                 max_files=1,
+                                 new_file=lambda: tempfile.SpooledTemporaryFile(max_size=1024 * 1024))
+        archive = None
+        async for part in upload.files():
+            archive = part
+    except UploadTooLarge:
+        # max_files=1: второй файл обрывает поток тем же исключением, но это не превышение размера
+        if upload is not None and upload.files_seen > 1:
+            raise HTTPException(400, "Exactly one archive file expected")
         raise HTTPException(413, f"Archive too large (>{settings.batch_max_archive_mb} MB)")
+    except MalformedUpload as e:
+        raise _upload_error(e)
+    if archive is None:
+        raise HTTPException(400, "No archive provided")
 
-    pairs = await FileHelper.read_archive_images(archive_bytes=raw)
-    if not pairs:
-        raise HTTPException(400, "No images found in archive")
+    try:
+        return await _detect_archive(request, archive, upload.fields, started)
+    except BaseException:
+        archive.file.close()
+        raise
 
-    if len(pairs) > settings.batch_max_files:
-        pairs = pairs[:settings.batch_max_files]
 
-    names = [n for (n, _) in pairs]
-    blobs = [b for (_, b) in pairs]
+async def _detect_archive(request: Request, archive, fields: dict[str, str], started: float):
+    form, detector, class_filter = _stream_form(fields)
+    model_name, bs, imgsz = form.model_name, form.bs, form.imgsz
+    logging.info(f"/detect({model_name=})")
+    timings, capture = _request_profile(form.profile, request, "detect_archive", stream=form.stream, started=started)
 
-    await _model_manager.get(model_name)
+    members = await asyncio.to_thread(FileHelper.iter_archive_images,
+                                      fileobj=archive.file,
+                                      limit=settings.batch_max_files)
+    first = await asyncio.to_thread(next, members, None)
+    if first is None:
+        raise HTTPException(400, "No images found in archive")
 
-    try:
-        results = await detector.detect_many(
-            images=blobs,
-            model_name=model_name,
-            batch_size=bs,
-            imgsz=imgsz
-        )
-    except Exception as e:
-        raise HTTPException(500, f"Batch inference failed: {e}")
+    # имена копятся по мере чтения архива — к моменту выдачи результата idx уже известен
+    names: list[str] = []
+
+    def blobs():
+        for name, data in itertools.chain([first], members):
+            names.append(name)
+            yield data
 
-    items = [{"filename": fn, **res} for fn, res in zip(names, results)]
+    await check_model(detector, model_name)
 
     summary = {
         "archive_name": archive.filename,
-        "images_found": len(pairs),
-        "processed": len(items),
         "failed": 0,
         "model": model_name,
         "batch": bs,
         "imgsz": imgsz,
     }
-    return JSONResponse({"items": items, "errors": [], "summary": summary})
\ No newline at end of file
+    if form.stream:
+        return _ndjson_response(
+            detector.iter_detect_many(images=blobs(), model_name=model_name, batch_size=bs, imgsz=imgsz,
+                                      class_filter=class_filter),
+            names=names,
+            summary=summary,
+            background=BackgroundTask(archive.file.close),
+            timings=timings,
+        )
+
+    with _profiled(timings, capture):
+        try:
+            with PerformanceLogger(logger=logger, message="Archive detect", stage="request_archive", model=model_name):
+                results = await detector.detect_many(
+                    images=blobs(),
+                    model_name=model_name,
+                    batch_size=bs,
+                    imgsz=imgsz,
+                    class_filter=class_filter,
+                )
+        except InferenceQueueFull as e:
+            raise HTTPException(503, str(e))
+        except Exception as e:
+            raise HTTPException(500, f"Batch inference failed: {e}")
+        finally:
+            archive.file.close()
+
+        items = [{"filename": fn, **res} for fn, res in zip(names, results)]
+        summary["images_found"] = len(names)
+        summary["processed"] = len(items)
+        return _json_response({"items": items, "errors": [], "summary": summary}, model_name, timings)
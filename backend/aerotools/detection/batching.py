@@ -0,0 +1,114 @@
+import asyncio
+import contextvars
+import logging
+from collections import Counter
+from typing import Any
+
+import numpy as np
+
+from ..inference_executor import InferenceExecutor
+from ..model_manager import ModelManager
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Собирает одиночные запросы к одной модели в общий батч:
+    до max_batch кадров или max_wait_ms ожидания, затем один model.predict.
+    """
+
+    IDLE_TIMEOUT_S = 30.0
+
+    def __init__(self, model_manager: ModelManager, executor: InferenceExecutor,
+                 max_batch: int, max_wait_ms: float):
+        self.model_manager = model_manager
+        self.executor = executor
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+
+        self._queues: dict[tuple, asyncio.Queue] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._histogram: Counter[int] = Counter()
+        self._requests = 0
+
+    async def submit(self, model_name: str, frame: np.ndarray, **predict_kwargs) -> Any:
+        key = (model_name, tuple(sorted(predict_kwargs.items())))
+        fut = asyncio.get_running_loop().create_future()
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = asyncio.Queue()
+            self._queues[key] = queue
+            # сборщик общий для многих запросов — не наследует timings того, кто его запустил
+            task = asyncio.create_task(self._collect(key, queue, model_name, predict_kwargs),
+                                       context=contextvars.Context())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        queue.put_nowait((frame, fut))
+        self._requests += 1
+        return await fut
+
+    async def _collect(self, key: tuple, queue: asyncio.Queue, model_name: str, predict_kwargs: dict):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                first = await asyncio.wait_for(queue.get(), timeout=self.IDLE_TIMEOUT_S)
+            except asyncio.TimeoutError:
+                # между таймаутом и удалением нет await — новых элементов появиться не могло
+                if queue.empty():
+                    del self._queues[key]
+                    return
+                continue
+
+            batch = [first]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # клиент мог отвалиться, пока ждали
+            batch = [(frame, fut) for frame, fut in batch if not fut.done()]
+            if not batch:
+                continue
+            self._histogram[len(batch)] += 1
+
+            try:
+                model = await self.model_manager.get(model_name)
+                results = await self.executor.predict(
+                    model,
+                    [frame for frame, _ in batch],
+                    model_name=model_name,
+                    batch=len(batch),
+                    verbose=False,
+                    **predict_kwargs,
+                )
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            for (_, fut), r in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(r)
+
+    def stats(self) -> dict:
+        batches = sum(self._histogram.values())
+        frames = sum(size * cnt for size, cnt in self._histogram.items())
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "requests": self._requests,
+            "batches": batches,
+            "avg_batch": round(frames / batches, 2) if batches else 0.0,
+            "histogram": {str(size): cnt for size, cnt in sorted(self._histogram.items())},
+        }
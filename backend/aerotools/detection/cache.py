@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    LRU-кэш результатов детекции по хэшу содержимого изображения и параметрам инференса.
+    Память ограничена по байтам сериализованного результата; опционально — второй уровень на диске.
+    """
+
+    def __init__(self, max_mb: float, disk_dir: str | None = None, disk_max_mb: float = 0):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = int(disk_max_mb * 1024 * 1024)
+
+        # get/put зовутся из потоков декодирования и постобработки
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, tuple[dict, int]]" = OrderedDict()
+        self._mem_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_dir is not None:
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(image_bytes: bytes, **params) -> str:
+        h = hashlib.sha256(image_bytes)
+        h.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0])
+
+            if key in self._disk:
+                path = self._disk_path(key)
+                try:
+                    raw = path.read_bytes()
+                    result = json.loads(raw)
+                    # mtime — порядок LRU после перезапуска
+                    os.utime(path)
+                except (OSError, ValueError):
+                    self._drop_disk(key)
+                else:
+                    self._disk.move_to_end(key)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._put_mem(key, result, len(raw))
+                    return dict(result)
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, result: dict):
+        raw = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._put_mem(key, result, len(raw))
+            if self.disk_dir is not None and key not in self._disk:
+                self._put_disk(key, raw)
+
+    def _put_mem(self, key: str, result: dict, size: int):
+        if size > self.max_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= old[1]
+        self._mem[key] = (result, size)
+        self._mem_bytes += size
+        while self._mem_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._mem.popitem(last=False)
+            self._mem_bytes -= evicted_size
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _put_disk(self, key: str, raw: bytes):
+        if len(raw) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        tmp = path.with_suffix(".tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_bytes(raw)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Result cache write failed for {path}: {e}")
+            return
+        self._disk[key] = len(raw)
+        self._disk_bytes += len(raw)
+        while self._disk_bytes > self.disk_max_bytes:
+            self._drop_disk(next(iter(self._disk)))
+            self.evictions += 1
+
+    def _drop_disk(self, key: str):
+        size = self._disk.pop(key, 0)
+        self._disk_bytes -= size
+        self._disk_path(key).unlink(missing_ok=True)
+
+    def _load_disk_index(self):
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        files = sorted(self.disk_dir.glob("*/*.json"), key=lambda p: p.stat().st_mtime)
+        for p in files:
+            size = p.stat().st_size
+            self._disk[p.stem] = size
+            self._disk_bytes += size
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            self._drop_disk(next(iter(self._disk)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory": {"entries": len(self._mem), "bytes": self._mem_bytes, "max_bytes": self.max_bytes},
+                "disk": {
+                    "enabled": self.disk_dir is not None,
+                    "entries": len(self._disk),
+                    "bytes": self._disk_bytes,
+                    "max_bytes": self.disk_max_bytes,
+                },
+            }
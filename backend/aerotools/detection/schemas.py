@@ -1,23 +1,7 @@
 from typing import TypedDict
 from dataclasses import dataclass
-
-
-@dataclass(frozen=True)
-class Box:
-    x1: float
-    y1: float
-    x2: float
-    y2: float
-
-    @classmethod
-    def from_xyxy(cls, xyxy: list[float], *,
-                  normalize_by: tuple[int, int]) -> "Box":
-        x1, y1, x2, y2 = map(float, xyxy)
-        w, h = normalize_by
-        return cls(x1 / w, y1 / h, x2 / w, y2 / h)
-
-    def as_list(self) -> list[float]:
-        return [self.x1, self.y1, self.x2, self.y2]
+from pydantic import BaseModel, ConfigDict, Field
+import numpy as np
 
 
 class DetectionDict(TypedDict, total=False):
@@ -25,4 +9,62 @@ class DetectionDict(TypedDict, total=False):
     class_name: str
     confidence: float
     bbox: list[float]
-    polygons: list[list[list[float]]]
\ No newline at end of file
+    polygons: list[list[list[float]]]
+
+
+class ToolClass(BaseModel):
+    """Класс из toolset-*.json: строка с именем или объект {"name": ..., "conf": 0.4}."""
+    name: str
+    conf: float | None = Field(default=None, ge=0, le=1)
+
+    @classmethod
+    def parse_toolset(cls, raw: list) -> list["ToolClass"]:
+        return [cls(name=e) if isinstance(e, str) else cls.model_validate(e) for e in raw]
+
+
+@dataclass(frozen=True)
+class ClassFilter:
+    """
+    Пороги уверенности по классам и подмножество классов запроса.
+    Detector.make_class_filter строит фильтр в индексах toolset, for_model переводит его в id модели;
+    predict_kwargs и keep_mask работают с id модели.
+    В model.predict уходит минимальный порог и список классов, точная отсечка — при сборке результата.
+    """
+    thresholds: tuple[float, ...]
+    class_ids: tuple[int, ...] | None = None
+    # порог для классов модели, которых нет в toolset
+    default: float = 0.25
+
+    def for_model(self, to_model: tuple[int, ...], n_model: int) -> "ClassFilter":
+        thresholds = [self.default] * n_model
+        for i, model_id in enumerate(to_model):
+            thresholds[model_id] = self.thresholds[i]
+        class_ids = tuple(sorted(to_model[i] for i in self.class_ids)) if self.class_ids is not None else None
+        return ClassFilter(thresholds=tuple(thresholds), class_ids=class_ids, default=self.default)
+
+    def predict_kwargs(self) -> dict:
+        ids = self.class_ids if self.class_ids is not None else range(len(self.thresholds))
+        kwargs = {"conf": min((self.thresholds[i] for i in ids), default=1.0)}
+        if self.class_ids is not None:
+            kwargs["classes"] = self.class_ids
+        return kwargs
+
+    def keep_mask(self, cls_ids: np.ndarray, confs: np.ndarray) -> np.ndarray:
+        keep = confs >= np.asarray(self.thresholds, dtype=np.float64)[cls_ids]
+        if self.class_ids is not None:
+            keep &= np.isin(cls_ids, self.class_ids)
+        return keep
+
+
+class BatchForm(BaseModel):
+    """Поля формы /detect/batch и /detect/archive — разбираются вручную из потока multipart."""
+    model_config = ConfigDict(extra="ignore")
+
+    model_name: str = "default"
+    bs: int = Field(default=8, ge=1, description="batch size")
+    imgsz: int = Field(default=640, ge=32, description="inference size")
+    stream: bool = Field(default=False, description="NDJSON: one line per image, then summary")
+    toolset: str | None = None
+    conf: str | None = Field(default=None, description='JSON {"class name": threshold}, overrides toolset')
+    classes: str | None = Field(default=None, description='JSON ["class name", ...] — detect only these')
+    profile: bool = Field(default=False, description="attach per-stage timings (ms) to the response")
@@ -1,157 +1,369 @@
-from typing import List, Dict, Tuple
-from ..utils.geometry import Point, GeometryHelper
-from ..utils.file_helper import FileHelper
-from .schemas import Box, DetectionDict
+from typing import List, Dict, Tuple, AsyncIterable, AsyncIterator, Iterable
+from ..utils.geometry import GeometryHelper
+from .schemas import DetectionDict, ClassFilter
+from .toolsets import Toolset, ToolsetBinding
 from ..model_manager import ModelManager
+from ..inference_executor import InferenceExecutor
+from ..decode_pool import DecodePool
+from .batching import MicroBatcher
+from .cache import ResultCache
+from ..settings import settings
+from ..logger import span
+from ..profiling import current_timings
+import asyncio
+import itertools
 import logging
-from collections import Counter
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 class Detector:
-    def __init__(self, model_manager: ModelManager, classes):
+    def __init__(self, model_manager: ModelManager, executor: InferenceExecutor, batcher: MicroBatcher,
+                 decoder: DecodePool, toolset: Toolset, cache: ResultCache | None = None):
         self.model_manager = model_manager
-        self.classes = classes
+        self.executor = executor
+        self.batcher = batcher
+        self.decoder = decoder
+        self.toolset = toolset
+        self.classes = toolset.names
+        self.cache = cache
+
+    def make_class_filter(self, conf: dict[str, float] | None = None,
+                          classes: list[str] | None = None) -> ClassFilter:
+        """
+        Порог класса: из запроса, иначе из toolset, иначе settings.default_conf.
+        """
+        conf = conf or {}
+        unknown = [n for n in [*conf, *(classes or [])] if n not in self.classes]
+        if unknown:
+            raise ValueError(f"Unknown classes {unknown}. Available: {self.classes}")
+
+        thresholds = tuple(
+            float(conf.get(name, default if default is not None else settings.default_conf))
+            for name, default in zip(self.classes, self.toolset.class_conf)
+        )
+        class_ids = tuple(sorted({self.toolset.index[n] for n in classes})) if classes else None
+        return ClassFilter(thresholds=thresholds, class_ids=class_ids, default=settings.default_conf)
+
+    async def bind_model(self, model_name: str) -> ToolsetBinding:
+        """
+        Сопоставляет классы модели с toolset по имени; модель загружается, только если её классы ещё неизвестны.
+        ValueError — модель неизвестна или не знает какой-то класс toolset.
+        """
+        return self.toolset.bind(await self.model_manager.names(model_name))
+
+    def _cache_key(self, image_bytes: bytes, **params) -> str | None:
+        if self.cache is None:
+            return None
+        return self.cache.make_key(image_bytes, toolset=self.toolset.name, classes=self.toolset.version, **params)
+
+    def _cache_lookup(self, image_bytes: bytes, **params) -> tuple[str | None, dict | None]:
+        key = self._cache_key(image_bytes, **params)
+        return key, (self.cache.get(key) if key is not None else None)
 
     async def detect(
         self,
         image_bytes: bytes,
         model_name: str,
         imgsz: int | tuple[int, int] = 640,
+        simplify_epsilon: float = 0.0,
+        class_filter: ClassFilter | None = None,
     ) -> Dict:
-        results = await self.detect_many(
-            images=[image_bytes],
-            model_name=model_name,
-            batch_size=1,
-            imgsz=imgsz,
-            include_polygons=True
-        )
-        return results[0] if results else {"detections": [], "match": {"overall": 0.0, "passed": False}}
+        # имя — по реестру, без загрузки: попадание в кэш не должно поднимать вытесненную модель
+        self.model_manager.check(model_name)
+        class_filter = class_filter or self.make_class_filter()
+        params = dict(model=model_name, checkpoint=self.model_manager.checkpoint_id(model_name),
+                      imgsz=imgsz, polygons=True, simplify=simplify_epsilon,
+                      decode_reduced=settings.decode_reduced,
+                      thresholds=class_filter.thresholds, class_ids=class_filter.class_ids,
+                      default_conf=class_filter.default)
+        with span("cache_lookup", model_name):
+            key, cached = await asyncio.to_thread(self._cache_lookup, image_bytes, **params)
+        if cached is not None:
+            return cached
+
+        with span("model_get", model_name):
+            binding = await self.bind_model(model_name)
+        model_filter = class_filter.for_model(binding.to_model, len(binding.model_names))
+
+        with span("decode", model_name):
+            np_img, size, scale = await self.decoder.decode(image_bytes, self._decode_target(imgsz))
+        w, h, scale = self._frame_size(size, scale)
+
+        # одиночные запросы склеиваются с параллельными в общий батч
+        with span("batch_wait", model_name):
+            r = await self.batcher.submit(model_name, np_img, imgsz=imgsz, **model_filter.predict_kwargs())
+        timings = current_timings()
+        if timings is not None:
+            # батч общий с другими запросами — берём долю этого кадра
+            timings.add_predict([r])
+        with span("postprocess", model_name):
+            result = self._build_result_for_frame(model_result=r,
+                                                  img_w=w,
+                                                  img_h=h,
+                                                  include_polygons=True,
+                                                  simplify_epsilon=simplify_epsilon,
+                                                  decode_scale=scale,
+                                                  binding=binding,
+                                                  class_filter=model_filter)
+        if key is not None:
+            await asyncio.to_thread(self.cache.put, key, result)
+        return result
 
     async def detect_many(
         self,
-        images: list[bytes],
+        images: Iterable[bytes] | AsyncIterable[bytes],
         model_name: str,
         batch_size: int = 8,
         imgsz: int | tuple[int, int] = 640,
         include_polygons: bool = False,
+        simplify_epsilon: float = 0.0,
+        class_filter: ClassFilter | None = None,
     ) -> list[dict]:
-        if not images:
-            return []
+        out: list[dict] = []
+        async for _, result in self.iter_detect_many(images=images,
+                                                     model_name=model_name,
+                                                     batch_size=batch_size,
+                                                     imgsz=imgsz,
+                                                     include_polygons=include_polygons,
+                                                     simplify_epsilon=simplify_epsilon,
+                                                     class_filter=class_filter):
+            out.append(result)
+        return out
 
-        np_imgs, sizes = [], []
-        for b in images:
-            np_img = FileHelper.bytes_to_numpy(image_bytes=b)
-            h, w = np_img.shape[:2]
-            np_imgs.append(np_img)
-            sizes.append((w, h))
+    async def iter_detect_many(
+        self,
+        images: Iterable[bytes] | AsyncIterable[bytes],
+        model_name: str,
+        batch_size: int = 8,
+        imgsz: int | tuple[int, int] = 640,
+        include_polygons: bool = False,
+        simplify_epsilon: float = 0.0,
+        class_filter: ClassFilter | None = None,
+    ) -> AsyncIterator[tuple[int, dict]]:
+        """
+        Отдаёт (индекс входного изображения, результат) по мере готовности каждого чанка.
 
-        model = await self.model_manager.get(model_name)
+        Конвейер: пока чанк k в модели, чанк k+1 декодируется в DecodePool,
+        а чанк k-1 постобрабатывается — в памяти одновременно не больше трёх чанков.
+        """
+        # async-источник (загрузка, разбираемая по мере прихода) читается в loop, обычный — в потоке декодирования
+        source = aiter(images) if isinstance(images, AsyncIterable) else iter(images)
+        class_filter = class_filter or self.make_class_filter()
+        self.model_manager.check(model_name)
+        params = dict(model=model_name, checkpoint=self.model_manager.checkpoint_id(model_name),
+                      imgsz=imgsz, polygons=include_polygons, simplify=simplify_epsilon,
+                      decode_reduced=settings.decode_reduced,
+                      thresholds=class_filter.thresholds, class_ids=class_filter.class_ids,
+                      default_conf=class_filter.default)
 
-        out: list[dict] = []
-        n = len(np_imgs)
-        for i in range(0, n, batch_size):
-            chunk = np_imgs[i:i + batch_size]
-
-            results = model.predict(
-                chunk,
-                imgsz=imgsz,
-                batch=min(batch_size, len(chunk)),
-                verbose=False,
-            )
-
-            for j, r in enumerate(results):
-                idx = i + j
-                img_w, img_h = sizes[idx]
-                out.append(self._build_result_for_frame(model_result=r,
-                                                        img_w=img_w,
-                                                        img_h=img_h,
-                                                        include_polygons=include_polygons))
+        target = self._decode_target(imgsz)
 
-        return out
+        def lookup_chunk(blobs: Iterable[bytes]) -> list[tuple[str | None, dict | None, bytes]]:
+            return [(*self._cache_lookup(b, **params), b) for b in blobs]
+
+        async def next_chunk() -> tuple[list[tuple[str | None, dict | None]], list[np.ndarray], list[tuple[float, float, int]]]:
+            if isinstance(source, AsyncIterator):
+                blobs = []
+                with span("read", model_name):
+                    async for b in source:
+                        blobs.append(b)
+                        if len(blobs) == batch_size:
+                            break
+                with span("cache_lookup", model_name):
+                    looked_up = await asyncio.to_thread(lookup_chunk, blobs)
+            else:
+                # чтение из архива идёт в том же потоке, что и поиск в кэше
+                with span("read_lookup", model_name):
+                    looked_up = await asyncio.to_thread(lambda: lookup_chunk(itertools.islice(source, batch_size)))
+
+            # попадания в кэш не декодируются и не идут в модель
+            misses = [b for _, cached, b in looked_up if cached is None]
+            if misses:
+                with span("decode", model_name):
+                    decoded = await self.decoder.decode_many(misses, target)
+            else:
+                decoded = []
+            entries = [(key, cached) for key, cached, _ in looked_up]
+            frames = [np_img for np_img, _, _ in decoded]
+            sizes = [self._frame_size(size, scale) for _, size, scale in decoded]
+            return entries, frames, sizes
+
+        def postprocess_chunk(entries, results, sizes: list[tuple[float, float, int]]) -> list[dict]:
+            with span("postprocess", model_name):
+                return build_chunk(entries, results, sizes)
+
+        def build_chunk(entries, results, sizes: list[tuple[float, float, int]]) -> list[dict]:
+            built = iter(zip(results, sizes))
+            out = []
+            for key, cached in entries:
+                if cached is not None:
+                    out.append(cached)
+                    continue
+                r, (img_w, img_h, scale) = next(built)
+                result = self._build_result_for_frame(model_result=r,
+                                                      img_w=img_w,
+                                                      img_h=img_h,
+                                                      include_polygons=include_polygons,
+                                                      simplify_epsilon=simplify_epsilon,
+                                                      decode_scale=scale,
+                                                      binding=binding,
+                                                      class_filter=model_filter)
+                if key is not None:
+                    self.cache.put(key, result)
+                out.append(result)
+            return out
+
+        next_decode = asyncio.create_task(next_chunk())
+        pending_post: tuple[int, asyncio.Task] | None = None
+        offset = 0
+        binding: ToolsetBinding | None = None
+        model_filter: ClassFilter | None = None
+        # модель загружается к первому промаху кэша: чанки из одних попаданий её не трогают
+        model = None
+        try:
+            # до первой постобработки: postprocess_chunk читает binding и model_filter
+            with span("model_get", model_name):
+                binding = await self.bind_model(model_name)
+            model_filter = class_filter.for_model(binding.to_model, len(binding.model_names))
+            while True:
+                entries, frames, sizes = await next_decode
+                if not entries:
+                    break
+                next_decode = asyncio.create_task(next_chunk())
+
+                results = []
+                if frames:
+                    if model is None:
+                        with span("model_get", model_name):
+                            model = await self.model_manager.get(model_name)
+                    results = await self.executor.predict(
+                        model,
+                        frames,
+                        model_name=model_name,
+                        imgsz=imgsz,
+                        batch=min(batch_size, len(frames)),
+                        verbose=False,
+                        **model_filter.predict_kwargs(),
+                    )
+                del frames
+
+                if pending_post is not None:
+                    start, task = pending_post
+                    for j, res in enumerate(await task):
+                        yield start + j, res
+                pending_post = (offset, asyncio.create_task(
+                    asyncio.to_thread(postprocess_chunk, entries, results, sizes)))
+                offset += len(entries)
+                del results
+
+            if pending_post is not None:
+                start, task = pending_post
+                pending_post = None
+                for j, res in enumerate(await task):
+                    yield start + j, res
+        finally:
+            # генератор могли закрыть досрочно (клиент отключился) — не оставляем висящих задач
+            next_decode.cancel()
+            if pending_post is not None:
+                pending_post[1].cancel()
+
+    @staticmethod
+    def _decode_target(imgsz: int | tuple[int, int]) -> int | None:
+        if not settings.decode_reduced:
+            return None
+        return max(imgsz) if isinstance(imgsz, (tuple, list)) else imgsz
+
+    @staticmethod
+    def _frame_size(size: tuple[int, int], scale: int) -> tuple[float, float, int]:
+        """
+        (w, h, scale) для нормализации: координаты модели — в пикселях уменьшенного кадра,
+        поэтому исходный размер переводится в те же единицы (w / scale), а не берётся из shape.
+        """
+        w, h = size
+        return w / scale, h / scale, scale
 
     def _build_result_for_frame(
             self,
             model_result,
-            img_w: int,
-            img_h: int,
+            img_w: float,
+            img_h: float,
             include_polygons: bool,
+            binding: ToolsetBinding,
+            simplify_epsilon: float = 0.0,
+            class_filter: ClassFilter | None = None,
+            decode_scale: int = 1,
     ) -> Dict:
+        """
+        class_id — id модели, class_name и match — через binding; class_filter — уже в id модели (ClassFilter.for_model).
+        """
         boxes = getattr(model_result, "boxes", None)
         masks = getattr(model_result, "masks", None)
 
         detections: List[DetectionDict] = []
-        class_ids_for_counter: list[int] = []
+        cls_arr = np.empty(0, dtype=np.int64)
 
         if boxes is not None:
-            m = len(boxes)
-            for i in range(m):
-                cls_id = int(boxes.cls[i].item())
-                conf = float(boxes.conf[i].item())
+            # один перенос на CPU вместо .item()/.tolist() по каждому полю каждой рамки
+            np_boxes = boxes.cpu().numpy()
+
+            if class_filter is not None:
+                # рамки ниже порога своего класса отбрасываются до построения полигонов
+                keep = class_filter.keep_mask(np_boxes.cls.astype(np.int64), np_boxes.conf)
+                if not keep.all():
+                    idx = np.flatnonzero(keep)
+                    np_boxes = np_boxes[idx]
+                    masks = masks[idx] if masks is not None else None
 
-                bbox_raw = boxes.xyxy[i].tolist()
-                bbox = Box.from_xyxy(bbox_raw, normalize_by=(img_w, img_h)).as_list()
+            m = len(np_boxes)
+            polys_by_det = self._frame_polygons(masks, m, img_w, img_h,
+                                                simplify_epsilon / decode_scale) if include_polygons else None
 
+            cls_arr = np_boxes.cls.astype(np.int64)
+            cls_ids = cls_arr.tolist()
+            confs = np_boxes.conf.tolist()
+            bboxes = GeometryHelper.normalize_boxes(np_boxes.xyxy, img_w, img_h).tolist()
+
+            for i, (cls_id, conf, bbox) in enumerate(zip(cls_ids, confs, bboxes)):
                 det: DetectionDict = {
                     "class_id": cls_id,
-                    "class_name": self.classes[cls_id],
+                    "class_name": binding.model_names[cls_id],
                     "confidence": conf,
                     "bbox": bbox,
                 }
 
-                if masks is not None and include_polygons:
-                    mask_xy = masks.xy[i]
-                    contours = mask_xy if isinstance(mask_xy, list) else [mask_xy]
-                    polys: list[list[list[float]]] = []
-                    for arr in contours:
-                        raw_poly: list[Point] = [
-                            GeometryHelper.normalize_and_clamp(float(x), float(y), img_w, img_h)
-                            for (x, y) in arr
-                        ]
-                        poly: list[Point] = raw_poly
-                        poly = [*poly, poly[0]]
-                        if len(poly) >= 3:
-                            polys.append([[x, y] for (x, y) in poly])
-                    if polys:
-                        det["polygons"] = polys
+                if polys_by_det and polys_by_det[i]:
+                    det["polygons"] = polys_by_det[i]
 
                 detections.append(det)
-                class_ids_for_counter.append(cls_id)
-
-        counts_by_id = Counter(class_ids_for_counter)
-        detected_ids = set(counts_by_id.keys())
-
-        counts_by_name = {name: counts_by_id.get(i, 0) for i, name in enumerate(self.classes)}
-        not_detected_ids = {i for i in range(len(self.classes)) if i not in detected_ids}
-
-        # ожидается ровно по ОДНОМУ экземпляру каждого класса
-        overdetected_pairs = {i: (cnt - 1) for i, cnt in counts_by_id.items() if cnt > 1}
-        overdetected = {self.classes[i]: extra for i, extra in overdetected_pairs.items()}
-
-        all_present = (len(not_detected_ids) == 0)
-        no_duplicates = (len(overdetected) == 0)
-        exact_set_match = all_present and no_duplicates
-
-        stats = {
-            "total_detections": sum(counts_by_id.values()),
-            "unique_detected": len(detected_ids),
-            "counts": counts_by_name,
-            "detected": sorted(self.classes[i] for i in detected_ids),
-            "not_detected": sorted(self.classes[i] for i in not_detected_ids),
-            "extra_detected": [],
-            "overdetected": overdetected,
-            "expected_each": 1,
-            "match_expected_set": {
-                "all_present": all_present,
-                "no_duplicates": no_duplicates,
-                "passed": exact_set_match,
-            },
-        }
-
-        overall = round(len(detected_ids) / len(self.classes), 3) if self.classes else 0.0
 
+        match = binding.match(cls_arr)
         return {
             "detections": detections,
-            "match": {"overall": overall},
-            "stats": stats,
+            "match": {"overall": match["overall"]},
+            "stats": match["stats"],
         }
+
+    @staticmethod
+    def _frame_polygons(masks, m: int, img_w: int, img_h: int,
+                        simplify_epsilon: float = 0.0) -> list[list[list[list[float]]]] | None:
+        """
+        Нормализует контуры всех детекций кадра одним векторным проходом и раскладывает по детекциям.
+        simplify_epsilon > 0 — RDP-упрощение каждого контура (в пикселях исходного изображения).
+        """
+        if masks is None:
+            return None
+
+        contours, owners = [], []
+        for i, mask_xy in enumerate(masks.xy[:m]):
+            for arr in (mask_xy if isinstance(mask_xy, list) else [mask_xy]):
+                if simplify_epsilon > 0:
+                    arr = GeometryHelper.rdp(arr, simplify_epsilon)
+                contours.append(arr)
+                owners.append(i)
+
+        polys_by_det: list[list[list[list[float]]]] = [[] for _ in range(m)]
+        for owner, poly in zip(owners, GeometryHelper.normalize_polygons(contours, img_w, img_h)):
+            if poly is not None:
+                polys_by_det[owner].append(poly)
+        return polys_by_det
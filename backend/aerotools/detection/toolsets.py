@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from .schemas import ToolClass
+
+logger = logging.getLogger(__name__)
+
+
+class Toolset:
+    """
+    Набор инструментов с заранее посчитанными таблицами для match/stats:
+    сопоставление кадра с набором — один bincount и сравнение с массивом ожидаемых количеств.
+    """
+
+    def __init__(self, name: str, classes: list[ToolClass]):
+        if not classes:
+            raise ValueError("no classes")
+        names = [c.name for c in classes]
+        if len(set(names)) != len(names):
+            raise ValueError("duplicate class names")
+
+        self.name = name
+        self.classes = classes
+        self.names = names
+        self.index = {n: i for i, n in enumerate(names)}
+        self.class_conf = [c.conf for c in classes]
+        # ожидается ровно по ОДНОМУ экземпляру каждого класса
+        self.expected = np.ones(len(names), dtype=np.int64)
+        # порядок имён для sorted(...) в stats — считаем один раз
+        self.sorted_ids = sorted(range(len(names)), key=names.__getitem__)
+        self.version = hashlib.sha1(
+            json.dumps([c.model_dump() for c in classes], ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:12]
+        # имена классов модели -> привязка; у модели свой порядок id, сопоставляем по имени
+        self._bindings: dict[tuple[str, ...], ToolsetBinding] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def bind(self, model_names: dict[int, str] | list[str]) -> "ToolsetBinding":
+        if isinstance(model_names, dict):
+            model_names = [model_names[i] for i in range(len(model_names))]
+        key = tuple(model_names)
+        binding = self._bindings.get(key)
+        if binding is None:
+            binding = ToolsetBinding(self, list(key))
+            self._bindings[key] = binding
+        return binding
+
+    def match(self, ts_ids: np.ndarray, extra_names: list[str] | None = None) -> dict:
+        """
+        ts_ids — индексы классов toolset; extra_names — обнаруженные классы модели, которых нет в toolset.
+        """
+        n = len(self.names)
+        counts = np.bincount(ts_ids, minlength=n)
+        extra = counts - self.expected
+        over = np.flatnonzero(extra > 0).tolist()
+        detected = (counts > 0).tolist()
+
+        unique_detected = sum(detected)
+        all_present = unique_detected == n
+        no_duplicates = not over
+
+        stats = {
+            "total_detections": int(len(ts_ids)) + len(extra_names or []),
+            "unique_detected": unique_detected,
+            "counts": dict(zip(self.names, counts.tolist())),
+            "detected": [self.names[i] for i in self.sorted_ids if detected[i]],
+            "not_detected": [self.names[i] for i in self.sorted_ids if not detected[i]],
+            "extra_detected": sorted(set(extra_names or [])),
+            "overdetected": {self.names[i]: int(extra[i]) for i in over},
+            "expected_each": 1,
+            "match_expected_set": {
+                "all_present": all_present,
+                "no_duplicates": no_duplicates,
+                "passed": all_present and no_duplicates,
+            },
+        }
+        return {"overall": round(unique_detected / n, 3), "stats": stats}
+
+    def as_dict(self) -> dict:
+        return {"name": self.name, "version": self.version, "classes": [c.model_dump() for c in self.classes]}
+
+
+class ToolsetBinding:
+    """
+    Соответствие id классов конкретной модели классам toolset (по имени).
+    Классы toolset, которых модель не знает, — ошибка запроса; лишние классы модели идут в extra_detected.
+    """
+
+    def __init__(self, toolset: Toolset, model_names: list[str]):
+        index = {name: i for i, name in enumerate(model_names)}
+        unknown = [n for n in toolset.names if n not in index]
+        if unknown:
+            raise ValueError(f"Toolset '{toolset.name}' has classes unknown to the model: {unknown}")
+
+        self.toolset = toolset
+        self.model_names = model_names
+        # id модели -> индекс toolset или -1
+        self.to_toolset = np.full(len(model_names), -1, dtype=np.int64)
+        self.to_model = tuple(index[n] for n in toolset.names)
+        self.to_toolset[list(self.to_model)] = np.arange(len(toolset.names))
+
+    def match(self, cls_ids: np.ndarray) -> dict:
+        ts_ids = self.to_toolset[cls_ids]
+        extra = [self.model_names[i] for i in cls_ids[ts_ids < 0].tolist()]
+        return self.toolset.match(ts_ids[ts_ids >= 0], extra)
+
+
+class ToolsetRegistry:
+    """
+    Все toolsets/*.json, загруженные и проверенные один раз.
+    Файл перечитывается, только если изменился его mtime; битый файл не заменяет рабочую версию.
+    """
+
+    def __init__(self, directory: str, default: str):
+        self.directory = Path(directory)
+        self.default = default
+        self._lock = threading.Lock()
+        self._toolsets: dict[str, tuple[int, Toolset]] = {}
+        for path in sorted(self.directory.glob("*.json")):
+            try:
+                self._load(path)
+            except ValueError as e:
+                logger.error(f"Invalid toolset {path}: {e}")
+
+    def _load(self, path: Path) -> Toolset:
+        mtime = path.stat().st_mtime_ns
+        try:
+            raw = json.loads(path.read_text(encoding="utf-8"))
+            if not isinstance(raw, list):
+                raise ValueError("expected a JSON list of classes")
+            toolset = Toolset(path.stem, ToolClass.parse_toolset(raw))
+        except ValueError as e:
+            # json.JSONDecodeError и pydantic.ValidationError — наследники ValueError
+            raise ValueError(f"Toolset '{path.stem}': {e}") from e
+        self._toolsets[path.stem] = (mtime, toolset)
+        logger.info(f"Loaded toolset '{path.stem}' ({len(toolset)} classes, version {toolset.version})")
+        return toolset
+
+    def get(self, name: str | None = None) -> Toolset:
+        name = name or self.default
+        path = self.directory / f"{name}.json"
+        if Path(name).name != name or not path.is_file():
+            raise ValueError(f"Unknown toolset '{name}'. Available: {self.available()}")
+
+        with self._lock:
+            entry = self._toolsets.get(name)
+            if entry is not None and entry[0] == path.stat().st_mtime_ns:
+                return entry[1]
+            try:
+                return self._load(path)
+            except (OSError, ValueError) as e:
+                if entry is None:
+                    raise ValueError(str(e)) from e
+                logger.error(f"Reload failed, keeping previous version: {e}")
+                return entry[1]
+
+    def available(self) -> list[str]:
+        return sorted(p.stem for p in self.directory.glob("*.json"))
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from .metrics import STAGE_SECONDS, observe_predict
+from .profiling import current_timings
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(RuntimeError):
+    pass
+
+
+class _TimingStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self) -> dict:
+        avg = self.total / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "avg_ms": round(avg * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+            "last_ms": round(self.last * 1000, 2),
+        }
+
+
+class InferenceExecutor:
+    """
+    Ограниченный пул потоков для model.predict, чтобы инференс не блокировал event loop.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+
+        # счётчики меняются и из loop, и из воркеров
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait = _TimingStats()
+        self._run = _TimingStats()
+
+        # один и тот же YOLO не потокобезопасен — предикты одной модели сериализуем
+        self._model_locks: "weakref.WeakKeyDictionary[Any, threading.Lock]" = weakref.WeakKeyDictionary()
+
+    def _model_lock(self, model) -> threading.Lock:
+        with self._lock:
+            lock = self._model_locks.get(model)
+            if lock is None:
+                lock = threading.Lock()
+                self._model_locks[model] = lock
+            return lock
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            if self._queued + self._running >= self.queue_size + self.workers:
+                self._rejected += 1
+                raise InferenceQueueFull(f"Inference queue is full ({self.queue_size} pending)")
+            self._queued += 1
+            self._submitted += 1
+        enqueued = time.monotonic()
+
+        def job():
+            started = time.monotonic()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._wait.add(started - enqueued)
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                elapsed = time.monotonic() - started
+                with self._lock:
+                    self._running -= 1
+                    self._run.add(elapsed)
+                    if ok:
+                        self._completed += 1
+                    else:
+                        self._failed += 1
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, job)
+
+    async def predict(self, model, source, model_name: str | None = None, **kwargs):
+        """
+        model_name — метка для /metrics; без неё (прогрев) предикт в метрики не попадает.
+        """
+        lock = self._model_lock(model)
+        enqueued = time.perf_counter()
+        # run_in_executor не переносит контекст в поток — timings запроса берём здесь
+        timings = current_timings()
+
+        def locked_predict():
+            with lock:
+                # ожидание пула и лока модели — очередь к этой модели
+                started = time.perf_counter()
+                results = model.predict(source, **kwargs)
+            finished = time.perf_counter()
+            if model_name is not None:
+                STAGE_SECONDS.observe(started - enqueued, "queue_wait", model_name)
+                STAGE_SECONDS.observe(finished - started, "predict", model_name)
+                observe_predict(model_name, results)
+            if timings is not None:
+                timings.add("queue_wait", started - enqueued)
+                timings.add("predict", finished - started)
+                timings.add_predict(results)
+            return results
+
+        return await self.run(locked_predict)
+
+    def release(self, model):
+        """Сбрасывает предиктор вытесненной модели, дождавшись её текущего predict. Блокирует — вызывать из потока."""
+        with self._model_lock(model):
+            model.predictor = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "wait": self._wait.as_dict(),
+                "run": self._run.as_dict(),
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
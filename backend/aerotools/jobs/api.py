@@ -0,0 +1,106 @@
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse
+import asyncio
+import logging
+from .service import JobManager, JobQueueFull, Job
+from ..detection.api import get_detector, get_class_filter, check_model
+from ..detection.schemas import ClassFilter
+from ..detection.service import Detector
+from ..settings import settings
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/jobs")
+
+_job_manager = JobManager(
+    root_dir=settings.jobs_dir,
+    queue_size=settings.jobs_queue_size,
+    workers=settings.jobs_workers,
+    ttl_hours=settings.jobs_ttl_hours,
+    max_files=settings.batch_max_files,
+)
+
+
+metrics.collector(lambda: [
+    ("aerotools_jobs_queue_depth", "gauge", "Archive jobs waiting for a worker",
+     [({}, _job_manager.stats()["queue_depth"])]),
+    ("aerotools_jobs", "gauge", "Archive jobs by status",
+     [({"status": s}, n) for s, n in _job_manager.stats()["by_status"].items()]),
+])
+
+
+@router.on_event("startup")
+async def _start_jobs():
+    _job_manager.start()
+
+
+@router.on_event("shutdown")
+async def _stop_jobs():
+    await _job_manager.stop()
+
+
+def _get_job(job_id: str) -> Job:
+    job = _job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job '{job_id}' not found")
+    return job
+
+
+@router.post(f"/archive")
+async def submit_archive(
+    archive: UploadFile = File(..., description="ZIP or TAR archive"),
+    model_name: str = Form(default="default"),
+    bs: int = Form(8, description="batch size"),
+    imgsz: int = Form(640, description="inference size"),
+    detector: Detector = Depends(get_detector),
+    class_filter: ClassFilter = Depends(get_class_filter),
+):
+    logging.info(f"/jobs/archive({archive.filename=}, {model_name=})")
+    max_bytes = settings.batch_max_archive_mb * 1024 * 1024
+    if archive.size is not None and archive.size > max_bytes:
+        raise HTTPException(413, f"Archive too large (>{settings.batch_max_archive_mb} MB)")
+    await check_model(detector, model_name)
+
+    try:
+        job = await _job_manager.submit(archive=archive.file, archive_name=archive.filename, detector=detector,
+                                        model_name=model_name, batch=bs, imgsz=imgsz,
+                                        class_filter=class_filter)
+    except JobQueueFull as e:
+        raise HTTPException(503, str(e))
+    return JSONResponse(job.as_dict(), status_code=202)
+
+
+# обработчики, которые трогают JobManager, — async: asyncio-объекты менеджера живут в event loop
+@router.get(f"")
+async def list_jobs():
+    return {"jobs": [j.as_dict() for j in _job_manager.all()], **_job_manager.stats()}
+
+
+@router.get(f"/{{job_id}}")
+async def job_status(job_id: str):
+    return _get_job(job_id).as_dict()
+
+
+@router.get(f"/{{job_id}}/results")
+async def job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    job = _get_job(job_id)
+    items = await asyncio.to_thread(_job_manager.results, job, offset=offset, limit=limit)
+    next_offset = offset + len(items)
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "offset": offset,
+        "items": items,
+        "next_offset": next_offset if next_offset < job.processed or not job.finished else None,
+    }
+
+
+@router.post(f"/{{job_id}}/cancel")
+async def cancel_job(job_id: str):
+    _get_job(job_id)
+    return _job_manager.cancel(job_id).as_dict()
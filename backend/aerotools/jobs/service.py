@@ -0,0 +1,303 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Literal
+
+from ..detection.schemas import ClassFilter
+from ..detection.service import Detector
+from ..utils.file_helper import FileHelper
+
+logger = logging.getLogger(__name__)
+
+JobStatus = Literal["queued", "running", "done", "failed", "cancelled"]
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+class Job:
+    ARCHIVE = "archive"
+    RESULTS = "results.ndjson"
+    META = "job.json"
+
+    def __init__(self, job_id: str, dir: Path, archive_name: str | None,
+                 model_name: str, batch: int, imgsz: int, class_filter: ClassFilter | None = None):
+        self.id = job_id
+        self.dir = dir
+        self.archive_name = archive_name
+        self.model_name = model_name
+        self.batch = batch
+        self.imgsz = imgsz
+        # нужен только на время обработки, в job.json не сохраняется
+        self.class_filter = class_filter
+
+        self.status: JobStatus = "queued"
+        self.error: str | None = None
+        self.total: int | None = None
+        self.processed = 0
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+        # байтовые смещения строк results.ndjson — для постраничной выдачи без чтения файла целиком
+        self.offsets: list[int] | None = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def as_dict(self) -> dict:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        throughput = self.processed / elapsed if elapsed else 0.0
+        eta = None
+        if self.status == "running" and self.total is not None and throughput > 0:
+            eta = round((self.total - self.processed) / throughput, 1)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "archive_name": self.archive_name,
+            "model": self.model_name,
+            "batch": self.batch,
+            "imgsz": self.imgsz,
+            "total": self.total,
+            "processed": self.processed,
+            "throughput": round(throughput, 2),
+            "eta_s": eta,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    def save(self):
+        tmp = self.dir / (self.META + ".tmp")
+        tmp.write_text(json.dumps(self.as_dict()))
+        os.replace(tmp, self.dir / self.META)
+
+    @classmethod
+    def load(cls, dir: Path) -> "Job":
+        meta = json.loads((dir / cls.META).read_text())
+        job = cls(meta["job_id"], dir, meta["archive_name"], meta["model"], meta["batch"], meta["imgsz"])
+        job.status = meta["status"]
+        job.error = meta["error"]
+        job.total = meta["total"]
+        job.processed = meta["processed"]
+        job.created_at = meta["created_at"]
+        job.started_at = meta["started_at"]
+        job.finished_at = meta["finished_at"]
+        job.offsets = None  # восстановим по файлу при первом запросе результатов
+        return job
+
+
+class JobManager:
+    """
+    Фоновая обработка архивов: задача ставится в ограниченную очередь, архив и результаты
+    (NDJSON, строка на изображение) лежат в jobs_dir/<job_id>/, прогресс опрашивается отдельно.
+    """
+
+    def __init__(self, root_dir: str, queue_size: int, workers: int, ttl_hours: float, max_files: int):
+        self.root = Path(root_dir)
+        self.queue_size = max(1, queue_size)
+        self.workers = max(1, workers)
+        self.ttl_s = ttl_hours * 3600
+        self.max_files = max_files
+
+        self._jobs: dict[str, Job] = {}
+        self._detectors: dict[str, Detector] = {}
+        self._queue: asyncio.Queue[str] | None = None
+        self._worker_tasks: list[asyncio.Task] = []
+        self._running: dict[str, asyncio.Task] = {}
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._load()
+        self.purge_expired()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for t in [*self._running.values(), *self._worker_tasks]:
+            t.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+
+    def _load(self):
+        for meta in self.root.glob(f"*/{Job.META}"):
+            try:
+                job = Job.load(meta.parent)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Skipping broken job {meta.parent.name}: {e}")
+                continue
+            if not job.finished:
+                # процесс перезапустился посреди обработки — очередь в памяти потеряна
+                job.status = "failed"
+                job.error = "Interrupted by server restart"
+                job.finished_at = time.time()
+                job.save()
+                (job.dir / Job.ARCHIVE).unlink(missing_ok=True)
+            self._jobs[job.id] = job
+
+    def purge_expired(self):
+        now = time.time()
+        for job in list(self._jobs.values()):
+            if job.finished and now - (job.finished_at or job.created_at) > self.ttl_s:
+                shutil.rmtree(job.dir, ignore_errors=True)
+                del self._jobs[job.id]
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def all(self) -> list[Job]:
+        return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    async def submit(self, archive: BinaryIO, archive_name: str | None, detector: Detector,
+                     model_name: str, batch: int, imgsz: int, class_filter: ClassFilter | None = None) -> Job:
+        if self._queue.full():
+            raise JobQueueFull(f"Job queue is full ({self.queue_size} pending)")
+        self.purge_expired()
+
+        job_id = uuid.uuid4().hex
+        job = Job(job_id, self.root / job_id, archive_name, model_name, batch, imgsz, class_filter)
+        job.dir.mkdir(parents=True)
+        try:
+            # загрузка закроется вместе с запросом — архив копируется на диск
+            await asyncio.to_thread(self._copy_archive, archive, job.dir / Job.ARCHIVE)
+            job.save()
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            shutil.rmtree(job.dir, ignore_errors=True)
+            raise JobQueueFull(f"Job queue is full ({self.queue_size} pending)")
+        except BaseException:
+            shutil.rmtree(job.dir, ignore_errors=True)
+            raise
+
+        # между put_nowait и этими строками нет await — воркер ещё не мог взять задачу
+        self._jobs[job_id] = job
+        self._detectors[job_id] = detector
+        logger.info(f"Job {job_id} queued ({archive_name}, {model_name=})")
+        return job
+
+    @staticmethod
+    def _copy_archive(src: BinaryIO, dst: Path):
+        src.seek(0)
+        with open(dst, "wb") as f:
+            shutil.copyfileobj(src, f, length=1 << 20)
+
+    def cancel(self, job_id: str) -> Job | None:
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        else:
+            # ещё в очереди — воркер пропустит
+            self._finish(job, "cancelled")
+        return job
+
+    def _finish(self, job: Job, status: JobStatus, error: str | None = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        job.save()
+        self._detectors.pop(job.id, None)
+        (job.dir / Job.ARCHIVE).unlink(missing_ok=True)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job.status != "queued":
+                continue
+            task = asyncio.create_task(self._run(job, self._detectors[job_id]))
+            self._running[job_id] = task
+            try:
+                await task
+            finally:
+                self._running.pop(job_id, None)
+
+    async def _run(self, job: Job, detector: Detector):
+        job.status = "running"
+        job.started_at = time.time()
+        job.save()
+        logger.info(f"Job {job.id} started")
+
+        names: list[str] = []
+        try:
+            with open(job.dir / Job.ARCHIVE, "rb") as archive, open(job.dir / Job.RESULTS, "wb") as out:
+                job.total = await asyncio.to_thread(FileHelper.count_archive_images, archive, self.max_files)
+                job.save()
+                members = FileHelper.iter_archive_images(archive, limit=self.max_files)
+
+                def blobs():
+                    for name, data in members:
+                        names.append(name)
+                        yield data
+
+                results = detector.iter_detect_many(images=blobs(), model_name=job.model_name,
+                                                    batch_size=job.batch, imgsz=job.imgsz,
+                                                    class_filter=job.class_filter)
+                async for idx, res in results:
+                    pos = out.tell()
+                    out.write((json.dumps({"filename": names[idx], **res}, ensure_ascii=False) + "\n").encode("utf-8"))
+                    out.flush()
+                    # смещение публикуется только после flush — читатель в потоке не увидит недописанную строку
+                    job.offsets.append(pos)
+                    job.processed += 1
+        except asyncio.CancelledError:
+            self._finish(job, "cancelled")
+            logger.info(f"Job {job.id} cancelled after {job.processed} images")
+            return
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            self._finish(job, "failed", f"Batch inference failed: {e}")
+            return
+
+        job.total = job.processed
+        self._finish(job, "done")
+        logger.info(f"Job {job.id} done: {job.processed} images")
+
+    def results(self, job: Job, offset: int, limit: int) -> list[dict]:
+        path = job.dir / Job.RESULTS
+        if not path.exists():
+            return []
+        if job.offsets is None:
+            job.offsets = self._scan_offsets(path)
+        # в offsets только строки, уже записанные и сброшенные на диск (см. _run)
+        offsets = job.offsets[offset:offset + limit]
+        if not offsets:
+            return []
+        items = []
+        with open(path, "rb") as f:
+            f.seek(offsets[0])
+            for _ in offsets:
+                items.append(json.loads(f.readline()))
+        return items
+
+    @staticmethod
+    def _scan_offsets(path: Path) -> list[int]:
+        offsets, pos = [], 0
+        with open(path, "rb") as f:
+            for line in f:
+                offsets.append(pos)
+                pos += len(line)
+        return offsets
+
+    def stats(self) -> dict:
+        by_status: dict[str, int] = {}
+        for job in self._jobs.values():
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {
+            "queue_size": self.queue_size,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "workers": self.workers,
+            "running": list(self._running),
+            "by_status": by_status,
+        }
@@ -3,6 +3,9 @@ import time
 import sys
 from logging import FileHandler, StreamHandler
 
+from .metrics import STAGE_SECONDS
+from .profiling import current_timings
+
 
 class OverWritingFileHandler(FileHandler):
     def __init__(self, filename, max_bytes):
@@ -32,15 +35,34 @@ def setup_package_logger():
 
 
 class PerformanceLogger:
-    def __init__(self, logger, message=None):
+    """
+    Span: замеряет блок (в том числе с await внутри). С stage длительность попадает
+    в гистограмму aerotools_stage_seconds{stage, model} и в timings запроса с profile=true,
+    с logger — строкой в лог.
+    """
+
+    def __init__(self, logger=None, message=None, stage: str | None = None, model: str | None = None):
         self.logger = logger
         self.message = message
+        self.stage = stage
+        self.model = model
         self.start = None
+        self.elapsed = 0.0
 
     def __enter__(self):
-        self.start = time.monotonic()
+        self.start = time.perf_counter()
         return self
 
     def __exit__(self, *args):
-        elapsed = time.monotonic() - self.start
-        self.logger.info(f"Execution took {elapsed:.2f} seconds")
\ No newline at end of file
+        self.elapsed = time.perf_counter() - self.start
+        if self.stage is not None:
+            STAGE_SECONDS.observe(self.elapsed, self.stage, self.model or "")
+            timings = current_timings()
+            if timings is not None:
+                timings.add(self.stage, self.elapsed)
+        if self.logger is not None:
+            self.logger.info(f"{self.message or 'Execution'} took {self.elapsed:.2f} seconds")
+
+
+def span(stage: str, model: str | None = None) -> PerformanceLogger:
+    return PerformanceLogger(stage=stage, model=model)
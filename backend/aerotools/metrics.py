@@ -0,0 +1,133 @@
+import bisect
+import math
+import threading
+from typing import Callable, Iterable
+
+# секунды: от декодирования маленького кадра до загрузки модели
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+# (имя, тип, описание, [(метки, значение)]) — значения, которые собираются в момент запроса /metrics
+MetricFamily = tuple[str, str, str, list[tuple[dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счётчики по корзинам (не накопительные), сумма, количество]
+        self._series: dict[tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self._series[label_values] = series
+            if idx < len(self.buckets):
+                series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(k, list(v[0]), v[1], v[2]) for k, v in sorted(self._series.items())]
+        for label_values, counts, total, count in snapshot:
+            labels = dict(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{_labels({**labels, 'le': _number(float(bound))})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels({**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Метрики в текстовом формате Prometheus.
+    Гистограммы пополняются по ходу работы; счётчики и gauge, которые уже ведут сами компоненты
+    (очереди, кэши, ModelManager), снимаются collector-функциями в момент запроса.
+    """
+
+    def __init__(self):
+        self._histograms: list[Histogram] = []
+        self._collectors: list[Callable[[], Iterable[MetricFamily]]] = []
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = STAGE_BUCKETS) -> Histogram:
+        h = Histogram(name, help, labels, buckets)
+        self._histograms.append(h)
+        return h
+
+    def collector(self, fn: Callable[[], Iterable[MetricFamily]]):
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines = []
+        for h in self._histograms:
+            lines.extend(h.render())
+        for fn in self._collectors:
+            for name, kind, help, samples in fn():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_labels(labels)} {_number(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "aerotools_stage_seconds",
+    "Duration of a processing stage (per request or per chunk)",
+    labels=("stage", "model"),
+)
+BATCH_SIZE = metrics.histogram(
+    "aerotools_batch_size",
+    "Frames per model.predict call",
+    labels=("model",),
+    buckets=BATCH_BUCKETS,
+)
+
+
+def predict_stage_seconds(results: list) -> dict[str, float]:
+    """
+    Внутренние этапы ultralytics за вызов predict: speed — мс на кадр, в среднем по батчу.
+    """
+    if not results:
+        return {}
+    n = len(results)
+    speed = getattr(results[0], "speed", None) or {}
+    return {stage: speed[key] * n / 1000
+            for key, stage in (("preprocess", "preprocess"), ("inference", "inference"), ("postprocess", "nms"))
+            if speed.get(key) is not None}
+
+
+def observe_predict(model_name: str, results: list):
+    if not results:
+        return
+    BATCH_SIZE.observe(len(results), model_name)
+    for stage, seconds in predict_stage_seconds(results).items():
+        STAGE_SECONDS.observe(seconds, stage, model_name)
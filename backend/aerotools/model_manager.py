@@ -1,34 +1,105 @@
 from collections import OrderedDict
+from pathlib import Path
 from typing import Dict
 import asyncio
+import os
+import threading
+import time
+import numpy as np
 import torch
 from ultralytics import YOLO
 from .settings import settings, ModelSpec
 import logging
 from .utils.file_helper import FileHelper
+from .utils.memory import MemoryHelper
+from .inference_executor import InferenceExecutor
 
 logger = logging.getLogger(__name__)
 
+
+class _ModelStats:
+    def __init__(self):
+        self.resident_bytes = 0
+        self.param_bytes = 0
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self.last_load_s = 0.0
+
+    def as_dict(self, loaded: bool) -> dict:
+        return {
+            "loaded": loaded,
+            "resident_mb": round(self.resident_bytes / 2**20, 1),
+            "param_mb": round(self.param_bytes / 2**20, 1),
+            "loads": self.loads,
+            "hits": self.hits,
+            "evictions": self.evictions,
+            "last_load_s": round(self.last_load_s, 2),
+        }
+
+
 class ModelManager:
-    def __init__(self, registry: dict[str, ModelSpec], capacity: int, device: str | None):
+    def __init__(self, registry: dict[str, ModelSpec], capacity: int, device: str | None,
+                 executor: InferenceExecutor, memory_budget_mb: float = 0, probe_imgsz: int = 640):
         self.registry = registry
+        self.executor = executor
         self.capacity = capacity
         self.device = device or ("cuda:0" if torch.cuda.is_available() else "cpu")
+        # 0 — вытеснение только по количеству (capacity)
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.probe_imgsz = probe_imgsz
 
         self._cache: "OrderedDict[str, YOLO]" = OrderedDict()
         self._locks: Dict[str, asyncio.Lock] = {}
+        # замер RSS — разница до/после загрузки; параллельная загрузка другой модели попала бы в замер
+        self._load_lock = threading.Lock()
+        # статистика переживает вытеснение: размер модели известен до повторной загрузки
+        self._stats: Dict[str, _ModelStats] = {}
+        # имена классов тоже: привязку toolset можно проверить, не загружая вытесненную модель
+        self._names: Dict[str, dict[int, str]] = {}
+        self._warmup_state: Dict[str, str] = {name: "pending" for name in settings.warmup_models}
+        self._warmup_done = False
 
     def _get_lock(self, name: str) -> asyncio.Lock:
         if name not in self._locks:
             self._locks[name] = asyncio.Lock()
         return self._locks[name]
 
-    async def get(self, name: str) -> YOLO:
+    def check(self, name: str):
         if name not in self.registry:
             raise ValueError(f"Unknown model '{name}'. Available: {list(self.registry)}")
 
+    def checkpoint_id(self, name: str) -> str:
+        """
+        Идентичность весов для ключей кэша результатов: sha256 из реестра, иначе mtime и размер файла,
+        плюс бэкенд и параметры экспорта. Замена чекпойнта под тем же именем меняет ключи.
+        """
+        spec = self.registry[name]
+        ident = spec.sha256
+        if not ident:
+            try:
+                st = os.stat(spec.path)
+                ident = f"{st.st_mtime_ns}-{st.st_size}"
+            except OSError:
+                ident = "missing"
+        if spec.backend == "torch":
+            return f"{ident}:torch"
+        return f"{ident}:{spec.backend}:{spec.export_imgsz}:{int(spec.export_dynamic)}"
+
+    async def names(self, name: str) -> dict[int, str]:
+        """model.names без загрузки, если модель уже загружалась; иначе загружает её."""
+        self.check(name)
+        names = self._names.get(name)
+        if names is None:
+            names = (await self.get(name)).names
+        return names
+
+    async def get(self, name: str) -> YOLO:
+        self.check(name)
+
         if name in self._cache:
             self._cache.move_to_end(name)
+            self._stats[name].hits += 1
             return self._cache[name]
 
         lock = self._get_lock(name)
@@ -38,24 +109,142 @@ class ModelManager:
                 return self._cache[name]
 
             spec = self.registry[name]
-            path = FileHelper.ensure_file(spec.path, spec.url, spec.sha256)
+            # хэширование чекпойнта — сотни МБ чтения, не в event loop
+            path = await FileHelper.ensure_file_async(spec.path, spec.url, spec.sha256)
+            if spec.backend != "torch":
+                path = await asyncio.to_thread(self._ensure_exported, path, spec)
+
+            stats = self._stats.setdefault(name, _ModelStats())
+            # освобождаем место заранее, если размер модели уже измерялся
+            await self._release(self._evict(incoming=stats.resident_bytes))
+
             logger.info(f"Loading model '{name}' from {path} on device:{self.device}")
+            start = time.monotonic()
+            model = await asyncio.to_thread(self._load_and_measure, str(path), stats)
+            stats.loads += 1
+            stats.last_load_s = time.monotonic() - start
+            logger.info(f"Model '{name}' resident ~{stats.resident_bytes / 2**20:.0f} MB "
+                        f"(params {stats.param_bytes / 2**20:.0f} MB)")
 
-            model: YOLO = await asyncio.to_thread(YOLO, str(path))
-            try:
-                model.to(self.device)
-            except Exception:
-                pass
             self._cache[name] = model
             self._cache.move_to_end(name)
-            while len(self._cache) > self.capacity:
-                self._cache.popitem(last=False)
+            self._names[name] = model.names
+            await self._release(self._evict())
 
             return model
 
+    def _load_and_measure(self, path: str, stats: _ModelStats) -> YOLO:
+        with self._load_lock:
+            return self._load_and_measure_locked(path, stats)
+
+    def _load_and_measure_locked(self, path: str, stats: _ModelStats) -> YOLO:
+        rss_before = MemoryHelper.process_rss_bytes()
+        cuda_before = MemoryHelper.cuda_allocated_bytes(self.device)
+
+        model = YOLO(path, task="segment")
+        try:
+            model.to(self.device)
+        except Exception:
+            pass
+
+        # пробный прогон: память активаций и предиктора входит в цену модели
+        if self.memory_budget and self.probe_imgsz:
+            probe = np.zeros((self.probe_imgsz, self.probe_imgsz, 3), dtype=np.uint8)
+            model.predict(probe, imgsz=self.probe_imgsz, verbose=False)
+
+        stats.param_bytes = MemoryHelper.module_bytes(model.model)
+        measured = (MemoryHelper.process_rss_bytes() - rss_before) + \
+                   (MemoryHelper.cuda_allocated_bytes(self.device) - cuda_before)
+        stats.resident_bytes = max(stats.param_bytes, measured)
+        return model
+
+    def resident_bytes(self) -> int:
+        return sum(self._stats[n].resident_bytes for n in self._cache)
+
+    def _over_budget(self, reserve: int) -> bool:
+        return bool(self.memory_budget) and self.resident_bytes() + reserve > self.memory_budget
+
+    def _evict(self, incoming: int | None = None) -> list[YOLO]:
+        """
+        incoming=None — после загрузки: самую свежую модель не трогаем, даже если она одна больше бюджета.
+        Иначе — перед загрузкой: освобождаем слот и incoming байт под новую модель.
+        Возвращает вытесненные модели — их освобождает _release.
+        """
+        limit = self.capacity if incoming is None else self.capacity - 1
+        keep = 1 if incoming is None else 0
+        evicted = []
+        while len(self._cache) > keep and (len(self._cache) > limit or self._over_budget(incoming or 0)):
+            name, model = self._cache.popitem(last=False)
+            self._stats[name].evictions += 1
+            logger.info(f"Evicting model '{name}' (~{self._stats[name].resident_bytes / 2**20:.0f} MB)")
+            evicted.append(model)
+        return evicted
+
+    async def _release(self, models: list[YOLO]):
+        if not models:
+            return
+        for model in models:
+            # предиктор держит ссылки на буферы и, на CUDA, тензоры; уже начатый predict дорабатывает
+            await asyncio.to_thread(self.executor.release, model)
+        del model, models
+        MemoryHelper.release(self.device)
+
+    def stats(self) -> dict:
+        return {
+            "device": self.device,
+            "capacity": self.capacity,
+            "memory_budget_mb": round(self.memory_budget / 2**20, 1),
+            "resident_mb": round(self.resident_bytes() / 2**20, 1),
+            "process_rss_mb": round(MemoryHelper.process_rss_bytes() / 2**20, 1),
+            "models": {name: st.as_dict(loaded=name in self._cache) for name, st in self._stats.items()},
+        }
+
+    @staticmethod
+    def exported_path(pt_path: Path, backend: str) -> Path:
+        # имена совпадают с теми, что формирует YOLO.export
+        if backend == "onnx":
+            return pt_path.with_suffix(".onnx")
+        if backend == "openvino":
+            return pt_path.parent / f"{pt_path.stem}_openvino_model"
+        raise ValueError(f"Unknown model backend '{backend}'")
+
+    @classmethod
+    def _ensure_exported(cls, pt_path: Path, spec: ModelSpec) -> Path:
+        target = cls.exported_path(pt_path, spec.backend)
+        if target.exists() and target.stat().st_mtime >= pt_path.stat().st_mtime:
+            return target
+
+        logger.info(f"Exporting {pt_path.name} to {spec.backend} (imgsz={spec.export_imgsz}, dynamic={spec.export_dynamic})")
+        exported = YOLO(str(pt_path)).export(
+            format=spec.backend,
+            imgsz=spec.export_imgsz,
+            dynamic=spec.export_dynamic,
+            device="cpu",
+        )
+        return Path(exported)
+
     async def warmup(self):
-        for name in settings.warmup_models:
-            try:
-                await self.get(name)
-            except Exception as e:
-                logger.error(f"[warmup] failed for {name}: {e}")
+        """
+        Параллельно загружает warmup_models и прогоняет по пустому кадру на каждом warmup_imgsz,
+        чтобы первый реальный запрос не платил за построение графа и инициализацию предиктора.
+        """
+        await asyncio.gather(*(self._warmup_one(name) for name in settings.warmup_models))
+        self._warmup_done = True
+        logger.info(f"[warmup] finished: {self._warmup_state}")
+
+    async def _warmup_one(self, name: str):
+        try:
+            self._warmup_state[name] = "loading"
+            model = await self.get(name)
+            for imgsz in settings.warmup_imgsz:
+                self._warmup_state[name] = f"warming imgsz={imgsz}"
+                dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+                await self.executor.predict(model, dummy, imgsz=imgsz, verbose=False)
+            self._warmup_state[name] = "ready"
+        except Exception as e:
+            self._warmup_state[name] = f"failed: {e}"
+            logger.error(f"[warmup] failed for {name}: {e}")
+
+    def readiness(self) -> dict:
+        ready = self._warmup_done and all(state == "ready" for state in self._warmup_state.values())
+        return {"ready": ready, "models": dict(self._warmup_state)}
@@ -0,0 +1,102 @@
+import contextvars
+import cProfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from .metrics import predict_stage_seconds
+
+
+class ProfileBusy(RuntimeError):
+    pass
+
+
+class RequestTimings:
+    """
+    Миллисекунды по этапам одного запроса (profile=true). Их пишут те же span-ы, что и /metrics.
+    Этапы конвейера перекрываются, поэтому сумма может быть больше total_ms.
+    """
+
+    def __init__(self, started: float | None = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.profile_dump: str | None = None
+        self._stages: dict[str, float] = {}
+        # постобработка и предикт пишут из потоков
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def add_predict(self, results: list):
+        for stage, seconds in predict_stage_seconds(results).items():
+            self.add(stage, seconds)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            stages = {k: round(v * 1000, 2) for k, v in self._stages.items()}
+        out = {"total_ms": round((time.perf_counter() - self.started) * 1000, 2), "stages_ms": stages}
+        if self.profile_dump is not None:
+            out["profile_dump"] = self.profile_dump
+        return out
+
+
+# задачи и asyncio.to_thread наследуют контекст — span-ы внутри запроса находят его timings
+_current: contextvars.ContextVar[RequestTimings | None] = contextvars.ContextVar("request_timings", default=None)
+
+
+def current_timings() -> RequestTimings | None:
+    return _current.get()
+
+
+def bind_timings(timings: RequestTimings):
+    """Привязывает timings к текущему контексту без сброса — для задачи, которая живёт один запрос."""
+    _current.set(timings)
+
+
+@contextmanager
+def collect_timings(timings: RequestTimings | None):
+    """Span-ы внутри блока пишут в timings; с None ничего не делает."""
+    if timings is None:
+        yield None
+        return
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+class ProfileCapture:
+    """
+    cProfile потока event loop на время запроса, дамп — profile_dir/<name>-<время>-<id>.prof
+    (открывается snakeviz или pstats). Инференс и декодирование в пулах видны как ожидание;
+    параллельные запросы попадают в тот же профиль. Одновременно — только один захват.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, directory: str, name: str, timings: RequestTimings):
+        self.directory = Path(directory)
+        # путь известен заранее: ответ с timings рендерится до конца захвата
+        self.path = self.directory / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof"
+        self.timings = timings
+        self._profiler: cProfile.Profile | None = None
+
+    def __enter__(self):
+        if not ProfileCapture._lock.acquire(blocking=False):
+            raise ProfileBusy("Another profile capture is in progress")
+        self.timings.profile_dump = str(self.path)
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, *args):
+        self._profiler.disable()
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._profiler.dump_stats(self.path)
+        finally:
+            ProfileCapture._lock.release()
@@ -1,3 +1,4 @@
+from typing import Literal
 from pydantic_settings import BaseSettings
 from pydantic import BaseModel, Field
 
@@ -8,6 +9,10 @@ class ModelSpec(BaseModel):
     path: str
     url: str | None = None
     sha256: str | None = None
+    # torch — .pt как есть; onnx/openvino — экспорт из .pt при первом обращении, кэшируется рядом с ним
+    backend: Literal["torch", "onnx", "openvino"] = "torch"
+    export_imgsz: int = 640
+    export_dynamic: bool = True
 
 
 default_model = ModelSpec(path=BASE_PATH + "best.pt",
@@ -34,10 +39,48 @@ class AppSettings(BaseSettings):
     )
     device: str | None = None
     lru_capacity: int = 3
+    # бюджет памяти под модели (RSS + CUDA), 0 — только lru_capacity
+    model_memory_budget_mb: float = 0
     warmup_models: list[str] = Field(default=["default"])
+    warmup_imgsz: list[int] = Field(default=[640])
+
+    toolsets_dir: str = "./toolsets"
+    default_toolset: str = "toolset-11"
+
+    # порог уверенности для классов без conf в toolset и в запросе (как у ultralytics по умолчанию)
+    default_conf: float = 0.25
+
+    # JPEG декодируется сразу близко к imgsz (DCT-scaling), а не в полном разрешении
+    decode_reduced: bool = True
+    # декодирование чанка: 0 — последовательно в одном потоке; process — кадры возвращаются через /dev/shm
+    decode_workers: int = 2
+    decode_mode: Literal["thread", "process"] = "thread"
+
+    inference_workers: int = 1
+    inference_queue_size: int = 16
+
+    microbatch_max_size: int = 8
+    microbatch_max_wait_ms: float = 15.0
+
+    result_cache_mb: float = 64
+    result_cache_dir: str | None = None
+    result_cache_disk_mb: float = 1024
+
+    # фоновые задачи по архивам: очередь, параллельность, хранение результатов
+    jobs_dir: str = "./jobs"
+    jobs_queue_size: int = 8
+    jobs_workers: int = 1
+    jobs_ttl_hours: float = 24
+
+    # profile=true — timings в ответе; с заголовком X-Admin-Token ещё и дамп cProfile в profile_dir
+    admin_token: str | None = None
+    profile_dir: str = "./profiles"
 
     batch_max_files: int = 500
     batch_max_archive_mb: int = 512
+    # /detect/batch: суммарный размер запроса и размер одного изображения
+    batch_max_upload_mb: int = 512
+    batch_max_image_mb: int = 32
     batch_allow_exts: tuple[str, ...] = (".jpg", ".jpeg", ".png")
 
     class Config:
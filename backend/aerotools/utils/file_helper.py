@@ -1,12 +1,17 @@
-import io, zipfile, tarfile
-import hashlib, os, urllib.request
-from pathlib import Path
+import io, math, zipfile, tarfile
+import hashlib, os, json, urllib.request, urllib.error
 import asyncio
-from typing import Iterable
+import logging
+from pathlib import Path
+import itertools
+from typing import BinaryIO, Iterable, Iterator
 from PIL import Image
 import numpy as np
 from ..settings import settings
 
+logger = logging.getLogger(__name__)
+
+
 class FileHelper:
     ALLOWED_EXTENSIONS = tuple(e.lower() for e in settings.batch_allow_exts)
 
@@ -15,43 +20,77 @@ class FileHelper:
         return name.lower().endswith(cls.ALLOWED_EXTENSIONS)
 
     @staticmethod
-    def bytes_to_numpy(image_bytes: bytes) -> np.ndarray:
-        pil_image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        np_image = np.array(pil_image)
-        return np_image
+    def decode_for_inference(image_bytes: bytes, target_size: int | None = None) -> tuple[np.ndarray, tuple[int, int], int]:
+        """
+        RGB-массив, исходные (w, h) и масштаб уменьшения (1, 2, 4 или 8).
+        JPEG уменьшается ещё при декодировании (DCT-scaling через PIL draft) так,
+        чтобы длинная сторона оставалась не меньше target_size — всё равно predict сожмёт до imgsz.
+        """
+        pil_image = Image.open(io.BytesIO(image_bytes))
+        w, h = pil_image.size
+        if target_size and pil_image.format == "JPEG" and max(w, h) >= 2 * target_size:
+            k = target_size / max(w, h)
+            pil_image.draft("RGB", (math.ceil(w * k), math.ceil(h * k)))
+        # размер после draft округляется вверх — масштаб берём точной степенью двойки
+        scale = 2 ** round(math.log2(w / pil_image.size[0]))
+        np_image = np.array(pil_image.convert("RGB"))
+        return np_image, (w, h), scale
 
     @classmethod
-    async def read_archive_images(cls, archive_bytes: bytes) -> Iterable[tuple[str, bytes]]:
-        bio = io.BytesIO(archive_bytes)
-
-        def try_zip() -> list[tuple[str, bytes]]:
-            out: list[tuple[str, bytes]] = []
-            with zipfile.ZipFile(bio, "r") as z:
-                for info in cls._safe_members_zip(z):
-                    if cls.is_allowed_name(info.filename):
-                        out.append((info.filename, z.read(info)))
-            return out
-
-        def try_tar() -> list[tuple[str, bytes]]:
-            out: list[tuple[str, bytes]] = []
-            bio.seek(0)
+    def iter_archive_images(cls, fileobj: BinaryIO, limit: int | None = None) -> Iterator[tuple[str, bytes]]:
+        """
+        Лениво читает изображения из ZIP/TAR по одному члену за раз.
+        fileobj — загруженный файл (SpooledTemporaryFile), архив целиком в память не читается.
+        """
+        fileobj.seek(0)
+        if zipfile.is_zipfile(fileobj):
+            members = cls._iter_zip_images(fileobj)
+        else:
+            fileobj.seek(0)
+            members = cls._iter_tar_images(fileobj)
+        return itertools.islice(members, limit) if limit is not None else members
+
+    @classmethod
+    def count_archive_images(cls, fileobj: BinaryIO, limit: int | None = None) -> int:
+        """
+        Число изображений в архиве без чтения их содержимого (для TAR — проход по заголовкам).
+        """
+        fileobj.seek(0)
+        if zipfile.is_zipfile(fileobj):
+            fileobj.seek(0)
+            with zipfile.ZipFile(fileobj, "r") as z:
+                count = sum(1 for info in cls._safe_members_zip(z) if cls.is_allowed_name(info.filename))
+        else:
+            fileobj.seek(0)
             try:
-                with tarfile.open(fileobj=bio, mode="r:*") as t:
-                    for m in cls._safe_members_tar(t):
-                        if cls.is_allowed_name(m.name):
-                            f = t.extractfile(m)
-                            if f:
-                                out.append((m.name, f.read()))
+                with tarfile.open(fileobj=fileobj, mode="r|*") as t:
+                    count = sum(1 for m in cls._safe_members_tar(t) if cls.is_allowed_name(m.name))
             except tarfile.ReadError:
-                # не tar — вернем пусто
-                return []
-            return out
+                count = 0
+        fileobj.seek(0)
+        return min(count, limit) if limit is not None else count
 
-        # блокирующие операции — в thread
-        imgs = await asyncio.to_thread(try_zip)
-        if imgs:
-            return imgs
-        return await asyncio.to_thread(try_tar)
+    @classmethod
+    def _iter_zip_images(cls, fileobj: BinaryIO) -> Iterator[tuple[str, bytes]]:
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj, "r") as z:
+            for info in cls._safe_members_zip(z):
+                if cls.is_allowed_name(info.filename):
+                    yield info.filename, z.read(info)
+
+    @classmethod
+    def _iter_tar_images(cls, fileobj: BinaryIO) -> Iterator[tuple[str, bytes]]:
+        try:
+            # "r|*" — потоковый режим, без предварительного getmembers() по всему архиву
+            with tarfile.open(fileobj=fileobj, mode="r|*") as t:
+                for m in cls._safe_members_tar(t):
+                    if cls.is_allowed_name(m.name):
+                        f = t.extractfile(m)
+                        if f:
+                            yield m.name, f.read()
+        except tarfile.ReadError:
+            # не tar — вернем пусто
+            return
 
     @staticmethod
     def _safe_members_zip(z: zipfile.ZipFile) -> Iterable[zipfile.ZipInfo]:
@@ -64,7 +103,7 @@ class FileHelper:
 
     @staticmethod
     def _safe_members_tar(t: tarfile.TarFile) -> Iterable[tarfile.TarInfo]:
-        for m in t.getmembers():
+        for m in t:
             if not m.isfile():
                 continue
             name = m.name
@@ -72,12 +111,28 @@ class FileHelper:
                 continue
             yield m
 
+    # path -> (mtime_ns, size, sha256): повторные загрузки модели после LRU не перечитывают файл
+    _verified: dict[str, tuple[int, int, str]] = {}
+    _download_locks: dict[str, asyncio.Lock] = {}
+    DOWNLOAD_CHUNK = 1 << 20
+
+    @classmethod
+    async def ensure_file_async(cls, path: str, url: str | None, sha256: str | None) -> Path:
+        """
+        ensure_file в потоке под замком на файл: параллельные запросы одной модели качают её один раз,
+        разные файлы качаются одновременно.
+        """
+        key = str(Path(path).resolve())
+        lock = cls._download_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            return await asyncio.to_thread(cls.ensure_file, path, url, sha256)
+
     @classmethod
     def ensure_file(cls, path: str, url: str | None, sha256: str | None) -> Path:
         p = Path(path)
         if p.exists():
             if sha256:
-                got = cls._sha256sum(p)
+                got = cls._sha256_cached(p)
                 if got != sha256:
                     raise RuntimeError(f"Hash mismatch for {p.name}: {got} != {sha256}")
             return p
@@ -87,12 +142,12 @@ class FileHelper:
 
         p.parent.mkdir(parents=True, exist_ok=True)
         tmp = p.with_suffix(p.suffix + ".part")
-        print(f"Downloading {p.name} ...")
+        logger.info(f"Downloading {p.name} ...")
         try:
-            urllib.request.urlretrieve(url, tmp)
-            os.replace(tmp, p)
+            cls._download_resumable(url, tmp)
         except urllib.error.HTTPError as e:
-            if tmp.exists():
+            # 4xx — ресурс или смещение неверны, докачивать нечего; 5xx, 408 и 429 — временные, .part нужен для докачки
+            if 400 <= e.code < 500 and e.code not in (408, 429):
                 tmp.unlink(missing_ok=True)
             # Детализированная подсказка:
             raise RuntimeError(
@@ -102,12 +157,77 @@ class FileHelper:
             ) from e
 
         if sha256:
-            got = cls._sha256sum(p)
+            got = cls._sha256sum(tmp)
             if got != sha256:
+                tmp.unlink(missing_ok=True)
                 raise RuntimeError(f"Hash mismatch after download for {p.name}")
+        os.replace(tmp, p)
+        if sha256:
+            cls._remember_hash(p, sha256)
 
         return p
 
+    @classmethod
+    def _download_resumable(cls, url: str, tmp: Path):
+        """
+        Докачивает в tmp с места обрыва через HTTP Range. Сетевые ошибки оставляют .part для следующей попытки.
+        """
+        offset = tmp.stat().st_size if tmp.exists() else 0
+        request = urllib.request.Request(url)
+        if offset:
+            request.add_header("Range", f"bytes={offset}-")
+        try:
+            response = urllib.request.urlopen(request, timeout=60)
+        except urllib.error.HTTPError as e:
+            # 416 — .part уже содержит весь файл
+            if e.code == 416 and offset:
+                return
+            raise
+        with response:
+            # сервер мог проигнорировать Range и отдать файл целиком
+            mode = "ab" if offset and response.status == 206 else "wb"
+            if offset:
+                logger.info(f"Resuming {tmp.name} from {offset} bytes" if mode == "ab" else
+                            f"Server ignored Range for {tmp.name}, restarting")
+            with tmp.open(mode) as f:
+                for chunk in iter(lambda: response.read(cls.DOWNLOAD_CHUNK), b""):
+                    f.write(chunk)
+
+    @classmethod
+    def _sha256_cached(cls, p: Path) -> str:
+        st = p.stat()
+        key = str(p.resolve())
+        cached = cls._verified.get(key)
+        if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[2]
+
+        # между перезапусками — json рядом с файлом
+        sidecar = cls._sidecar(p)
+        try:
+            data = json.loads(sidecar.read_text())
+            if (data["mtime_ns"], data["size"]) == (st.st_mtime_ns, st.st_size):
+                cls._verified[key] = (st.st_mtime_ns, st.st_size, data["sha256"])
+                return data["sha256"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        got = cls._sha256sum(p)
+        cls._remember_hash(p, got)
+        return got
+
+    @classmethod
+    def _remember_hash(cls, p: Path, sha256: str):
+        st = p.stat()
+        cls._verified[str(p.resolve())] = (st.st_mtime_ns, st.st_size, sha256)
+        try:
+            cls._sidecar(p).write_text(json.dumps({"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": sha256}))
+        except OSError as e:
+            logger.warning(f"Cannot write hash cache for {p.name}: {e}")
+
+    @staticmethod
+    def _sidecar(p: Path) -> Path:
+        return p.with_name(p.name + ".sha256.json")
+
     @staticmethod
     def _sha256sum(p: Path) -> str:
         h = hashlib.sha256()
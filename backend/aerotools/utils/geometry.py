@@ -1,54 +1,61 @@
-import math
 from typing import Sequence
+import cv2
+import numpy as np
 
 Point = tuple[float, float]
 
 class GeometryHelper:
 
-    @classmethod
-    def normalize_and_clamp(cls, x: float, y: float, w: int, h: int,) -> Point:
-        x, y = x / w, y / h
-        return (cls._clamp01(x), cls._clamp01(y))
+    @staticmethod
+    def normalize_boxes(xyxy: np.ndarray, w: float, h: float) -> np.ndarray:
+        """(N, 4) пиксельных рамок xyxy -> (N, 4) нормализованных."""
+        return np.asarray(xyxy, dtype=np.float64).reshape(-1, 4) / np.array([w, h, w, h], dtype=np.float64)
 
     @classmethod
-    def _clamp01(cls, v: float) -> float:
-        return 0.0 if v < 0.0 else (1.0 if v > 1.0 else v)
+    def normalize_polygons(cls, contours: Sequence[np.ndarray], w: int, h: int) -> list[list[list[float]] | None]:
+        """
+        Векторная нормализация всех контуров кадра: деление на (w, h), обрезка в [0, 1], замыкание.
+        Возвращает список той же длины; вырожденные контуры (< 3 точек после замыкания) — None.
+        """
+        if not len(contours):
+            return []
+
+        arrays = [np.asarray(c, dtype=np.float64).reshape(-1, 2) for c in contours]
+        lengths = [len(a) for a in arrays]
+        pts = np.concatenate(arrays) if sum(lengths) else np.empty((0, 2), dtype=np.float64)
+        pts /= np.array([w, h], dtype=np.float64)
+        np.clip(pts, 0.0, 1.0, out=pts)
+
+        out: list[list[list[float]] | None] = []
+        for poly in np.split(pts, np.cumsum(lengths)[:-1]):
+            if len(poly) and (poly[0] != poly[-1]).any():
+                poly = np.concatenate([poly, poly[:1]])
+            out.append(poly.tolist() if len(poly) >= 3 else None)
+        return out
 
     @classmethod
     def _clamp_px(cls, v: float, limit: int) -> float:
         return 0.0 if v < 0 else (float(limit - 1) if v > limit - 1 else float(v))
 
 
+    # до RDP контур прореживается до стольких точек: худший случай RDP квадратичен по длине контура
+    RDP_MAX_POINTS = 2048
+
     @classmethod
-    def rdp(cls, points: Sequence[Point], epsilon: float) -> list[Point]:
+    def rdp(cls, points: Sequence[Point] | np.ndarray, epsilon: float) -> np.ndarray:
         """
-        Ramer–Douglas–Peucker упрощение ломаной.
+        Ramer–Douglas–Peucker упрощение ломаной через cv2.approxPolyDP (open curve, концы сохраняются).
+        Контур длиннее RDP_MAX_POINTS сначала прореживается равномерным шагом — время ограничено сверху
+        и на «пилообразных» контурах, где каждое деление отщепляет одну точку.
+        Возвращает (M, 2) массив сохранённых точек в исходном порядке.
         """
-        if epsilon <= 0 or len(points) < 3:
-            return list(points)
-
-        # найдём точку с макс. отклонением от прямой между концами
-        dmax, idx = 0.0, 0
-        start, end = points[0], points[-1]
-        for i in range(1, len(points) - 1):
-            d = cls._perp_distance(points[i], start, end)
-            if d > dmax:
-                dmax, idx = d, i
-
-        if dmax > epsilon:
-            left = cls.rdp(points[: idx + 1], epsilon)
-            right = cls.rdp(points[idx:], epsilon)
-            # склейка без дублирования стыковочной точки
-            return left[:-1] + right
-        return [start, end]
-
-
-    @classmethod
-    def _perp_distance(cls, pt: Point, a: Point, b: Point) -> float:
-        """Перпендикулярное расстояние от точки до отрезка AB (если A==B — до точки A)."""
-        (x, y), (x1, y1), (x2, y2) = pt, a, b
-        if x1 == x2 and y1 == y2:
-            return math.hypot(x - x1, y - y1)
-        num = abs((y2 - y1) * x - (x2 - x1) * y + x2 * y1 - y2 * x1)
-        den = math.hypot((y2 - y1), (x2 - x1))
-        return num / den
\ No newline at end of file
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        n = len(pts)
+        if epsilon <= 0 or n < 3:
+            return pts.copy()
+
+        if n > cls.RDP_MAX_POINTS:
+            idx = np.linspace(0, n - 1, cls.RDP_MAX_POINTS).round().astype(np.intp)
+            pts = pts[idx]
+        approx = cv2.approxPolyDP(pts.astype(np.float32).reshape(-1, 1, 2), float(epsilon), False)
+        return approx.reshape(-1, 2).astype(np.float64)
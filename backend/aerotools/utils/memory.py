@@ -0,0 +1,52 @@
+import ctypes
+import gc
+import resource
+import sys
+
+import torch
+
+
+class MemoryHelper:
+    _libc = None
+
+    @staticmethod
+    def process_rss_bytes() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                pages = int(f.read().split()[1])
+            return pages * resource.getpagesize()
+        except (OSError, ValueError, IndexError):
+            # не Linux — только пиковое значение
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    @staticmethod
+    def cuda_allocated_bytes(device: str) -> int:
+        if not device.startswith("cuda") or not torch.cuda.is_available():
+            return 0
+        return torch.cuda.memory_allocated(device)
+
+    @staticmethod
+    def module_bytes(module) -> int:
+        """Размер параметров и буферов torch-модуля; для не-torch объектов — 0."""
+        if not isinstance(module, torch.nn.Module):
+            return 0
+        total = 0
+        for t in (*module.parameters(), *module.buffers()):
+            total += t.numel() * t.element_size()
+        return total
+
+    @classmethod
+    def release(cls, device: str):
+        gc.collect()
+        if device.startswith("cuda") and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        # вернуть освобождённые арены glibc ОС, иначе RSS не падает
+        if cls._libc is None:
+            try:
+                libc = ctypes.CDLL("libc.so.6")
+                cls._libc = libc if hasattr(libc, "malloc_trim") else False
+            except OSError:
+                cls._libc = False
+        if cls._libc:
+            cls._libc.malloc_trim(0)
@@ -0,0 +1,162 @@
+import io
+from typing import AsyncIterator, BinaryIO, Callable
+
+from starlette.requests import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, MultipartParseError, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, MultipartParseError, parse_options_header
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class MalformedUpload(ValueError):
+    pass
+
+
+class StreamPart:
+    def __init__(self, name: str, filename: str, file: BinaryIO):
+        self.name = name
+        self.filename = filename
+        self.file = file
+
+    def read(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+
+class MultipartStream:
+    """
+    Разбор multipart/form-data по мере прихода тела запроса, без буферизации всей загрузки.
+    Лимиты проверяются на каждом чанке; файл отдаётся, как только закончилась его часть.
+    Обычные поля собираются в self.fields и могут идти в любом месте тела: полный набор полей известен,
+    только когда files() исчерпан.
+    """
+
+    MAX_FIELD_BYTES = 64 * 1024
+
+    def __init__(self, request: Request, max_total_bytes: int, max_file_bytes: int | None = None,
+                 max_files: int | None = None, new_file: Callable[[], BinaryIO] = io.BytesIO):
+        self.request = request
+        self.max_total_bytes = max_total_bytes
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.new_file = new_file
+
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise MalformedUpload("Expected multipart/form-data with a boundary")
+
+        declared = request.headers.get("content-length")
+        if declared is not None and declared.isdigit() and int(declared) > max_total_bytes:
+            # отказ до чтения тела
+            raise UploadTooLarge(f"Upload too large (>{max_total_bytes // (1024 * 1024)} MB)")
+
+        self.fields: dict[str, str] = {}
+        self.files_seen = 0
+        self._completed: list[StreamPart] = []
+
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._headers: dict[bytes, bytes] = {}
+        self._name = ""
+        self._filename: str | None = None
+        self._value = bytearray()
+        self._file: BinaryIO | None = None
+        self._file_size = 0
+
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": lambda data, start, end: self._header_field.extend(data[start:end]),
+            "on_header_value": lambda data, start, end: self._header_value.extend(data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._value = bytearray()
+        self._file = None
+        self._file_size = 0
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self):
+        disposition, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if disposition != b"form-data" or b"name" not in options:
+            raise MalformedUpload("Part without a form-data name")
+        self._name = options[b"name"].decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        self._filename = filename.decode("utf-8", "replace") if filename is not None else None
+
+        if self._filename is None:
+            return
+        self.files_seen += 1
+        if self.max_files is not None and self.files_seen > self.max_files:
+            raise UploadTooLarge(f"Too many files (>{self.max_files})")
+        self._file = self.new_file()
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._file is None:
+            self._value.extend(data[start:end])
+            if len(self._value) > self.MAX_FIELD_BYTES:
+                raise UploadTooLarge(f"Field '{self._name}' too large")
+            return
+        self._file_size += end - start
+        if self.max_file_bytes is not None and self._file_size > self.max_file_bytes:
+            raise UploadTooLarge(f"File '{self._filename}' too large (>{self.max_file_bytes // (1024 * 1024)} MB)")
+        self._file.write(data[start:end])
+
+    def _on_part_end(self):
+        if self._file is None:
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+            return
+        self._file.seek(0)
+        self._completed.append(StreamPart(self._name, self._filename, self._file))
+        self._file = None
+
+    async def files(self) -> AsyncIterator[StreamPart]:
+        """
+        Файловые части в порядке прихода.
+        """
+        received = 0
+        async for chunk in self.request.stream():
+            received += len(chunk)
+            if received > self.max_total_bytes:
+                raise UploadTooLarge(f"Upload too large (>{self.max_total_bytes // (1024 * 1024)} MB)")
+            self._write(chunk)
+            while self._completed:
+                yield self._completed.pop(0)
+        self._write(None)
+        while self._completed:
+            yield self._completed.pop(0)
+
+    async def read_all(self) -> list[StreamPart]:
+        """Дочитывает тело целиком; при ошибке уже принятые файлы закрываются."""
+        parts: list[StreamPart] = []
+        try:
+            async for part in self.files():
+                parts.append(part)
+        except BaseException:
+            for part in parts:
+                part.file.close()
+            raise
+        return parts
+
+    def _write(self, chunk: bytes | None):
+        try:
+            if chunk is None:
+                self._parser.finalize()
+            else:
+                self._parser.write(chunk)
+        except MultipartParseError as e:
+            raise MalformedUpload(f"Malformed multipart body: {e}") from e
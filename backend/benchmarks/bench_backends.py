@@ -0,0 +1,98 @@
+"""
+Задержка и RSS инференса для разных бэкендов ModelManager (torch / onnx / openvino).
+Каждая пара (модель, бэкенд) меряется в отдельном процессе, чтобы RSS не смешивались.
+
+Запуск из папки backend:
+    uv run --extra cpu --extra onnx python -m benchmarks.bench_backends \\
+        --models default small nano --backends torch onnx --imgsz 640
+"""
+import argparse
+import asyncio
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def worker(model_name: str, backend: str, imgsz: int, runs: int, batch: int) -> dict:
+    from aerotools.inference_executor import InferenceExecutor
+    from aerotools.model_manager import ModelManager
+    from aerotools.settings import settings
+
+    spec = settings.models[model_name].model_copy(update={"backend": backend, "export_imgsz": imgsz})
+    manager = ModelManager(registry={model_name: spec}, capacity=1, device="cpu",
+                           executor=InferenceExecutor(workers=1, queue_size=1))
+
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    model = asyncio.run(manager.get(model_name))
+    load_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(0)
+    frames = [(rng.random((1080, 1440, 3)) * 255).astype(np.uint8) for _ in range(batch)]
+    model.predict(frames, imgsz=imgsz, batch=batch, verbose=False)
+
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict(frames, imgsz=imgsz, batch=batch, verbose=False)
+        latencies.append((time.perf_counter() - start) * 1000 / batch)
+    latencies.sort()
+
+    return {
+        "model": model_name,
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 1),
+        "rss_mb": round(_rss_mb(), 1),
+        "rss_model_mb": round(_rss_mb() - rss_before, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", nargs="+", default=["default", "small", "nano"])
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "openvino"])
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--worker", nargs=2, metavar=("MODEL", "BACKEND"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(*args.worker, imgsz=args.imgsz, runs=args.runs, batch=args.batch)))
+        return
+
+    print(f"{'model':>8} {'backend':>9} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8} {'model MB':>9} {'peak MB':>8}")
+    for model_name in args.models:
+        for backend in args.backends:
+            proc = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_backends", "--worker", model_name, backend,
+                 "--imgsz", str(args.imgsz), "--runs", str(args.runs), "--batch", str(args.batch)],
+                capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                err = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"
+                print(f"{model_name:>8} {backend:>9}  error: {err}")
+                continue
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"{r['model']:>8} {r['backend']:>9} {r['load_s']:>7} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+                  f"{r['rss_mb']:>8} {r['rss_model_mb']:>9} {r['peak_rss_mb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
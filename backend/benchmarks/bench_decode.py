@@ -0,0 +1,75 @@
+"""
+Пропускная способность DecodePool (изображений в секунду) при разном числе воркеров,
+в режимах thread и process, с декодированием в полном и в уменьшенном (--imgsz) размере.
+
+Запуск из папки backend:
+    uv run python -m benchmarks.bench_decode --images 64 --workers 0 1 2 4 --modes thread process
+"""
+import argparse
+import asyncio
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+from aerotools.decode_pool import DecodePool
+
+
+def make_jpegs(count: int, width: int, height: int) -> list[bytes]:
+    # шум поверх градиента — сжимается примерно как фото, а не как однотонная заливка
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 200, width, dtype=np.float32)[None, :, None]
+    blobs = []
+    for _ in range(count):
+        noise = rng.normal(0, 20, (height, width, 3)).astype(np.float32)
+        img = np.clip(gradient + noise + rng.integers(0, 55), 0, 255).astype(np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(img).save(buf, "JPEG", quality=90)
+        blobs.append(buf.getvalue())
+    return blobs
+
+
+async def measure(pool: DecodePool, blobs: list[bytes], chunk: int, target: int | None, repeat: int) -> float:
+    # прогрев: старт пула (для process — spawn и импорт модулей в воркерах)
+    await pool.decode_many(blobs[:chunk], target)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(0, len(blobs), chunk):
+            await pool.decode_many(blobs[i:i + chunk], target)
+        best = min(best, time.perf_counter() - start)
+    return len(blobs) / best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--chunk", type=int, default=8, help="как bs в /detect/batch")
+    parser.add_argument("--imgsz", type=int, default=640, help="цель уменьшенного декодирования")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--modes", nargs="+", choices=["thread", "process"], default=["thread", "process"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    blobs = make_jpegs(args.images, args.width, args.height)
+    print(f"{args.images} JPEG {args.width}x{args.height}, "
+          f"{sum(map(len, blobs)) / len(blobs) / 1024:.0f} KB avg, chunk {args.chunk}")
+    print(f"{'mode':>8} {'workers':>8} {'full img/s':>11} {f'imgsz={args.imgsz} img/s':>18}")
+
+    runs = [("inline", 0)] if 0 in args.workers else []
+    runs += [(mode, w) for mode in args.modes for w in args.workers if w > 0]
+    for mode, workers in runs:
+        pool = DecodePool(workers=workers, mode="thread" if mode == "inline" else mode)
+        try:
+            full = asyncio.run(measure(pool, blobs, args.chunk, None, args.repeat))
+            reduced = asyncio.run(measure(pool, blobs, args.chunk, args.imgsz, args.repeat))
+        finally:
+            pool.shutdown()
+        print(f"{mode:>8} {workers:>8} {full:>11.1f} {reduced:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Микробенчмарк нормализации полигонов: прежняя поточечная нормализация (normalize_and_clamp)
+против векторного GeometryHelper.normalize_polygons.
+
+Запуск из папки backend:
+    uv run python -m benchmarks.bench_polygons --points 2000 --tools 11
+"""
+import argparse
+import time
+
+import numpy as np
+
+from aerotools.utils.geometry import GeometryHelper
+
+
+def normalize_and_clamp(x: float, y: float, w: int, h: int) -> tuple[float, float]:
+    # эталон: бывший GeometryHelper.normalize_and_clamp
+    x, y = x / w, y / h
+    return (0.0 if x < 0.0 else (1.0 if x > 1.0 else x)), (0.0 if y < 0.0 else (1.0 if y > 1.0 else y))
+
+
+def per_point(contours: list[np.ndarray], w: int, h: int) -> list[list[list[float]]]:
+    # прежняя поточечная реализация из Detector._build_result_for_frame
+    polys = []
+    for arr in contours:
+        poly = [normalize_and_clamp(float(x), float(y), w, h) for (x, y) in arr]
+        if len(poly) >= 2 and poly[0] != poly[-1]:
+            poly = [*poly, poly[0]]
+        if len(poly) >= 3:
+            polys.append([[x, y] for (x, y) in poly])
+    return polys
+
+
+def vectorized(contours: list[np.ndarray], w: int, h: int) -> list[list[list[float]]]:
+    return [p for p in GeometryHelper.normalize_polygons(contours, w, h) if p is not None]
+
+
+def make_contours(tools: int, points: int, w: int, h: int, seed: int = 0) -> list[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    out = []
+    for _ in range(tools):
+        cx, cy = rng.uniform(0, w), rng.uniform(0, h)
+        t = np.linspace(0, 2 * np.pi, points, endpoint=False)
+        r = rng.uniform(50, 400) * (1 + 0.2 * np.sin(rng.integers(2, 6) * t + rng.uniform(0, np.pi)))
+        # контуры масок идут по пиксельной сетке — округляем, как в masks.xy
+        xy = np.round(np.stack([cx + r * np.cos(t), cy + r * np.sin(t)], axis=1))
+        out.append(xy.astype(np.float32))
+    return out
+
+
+def bench(fn, repeat: int, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tools", type=int, default=11)
+    parser.add_argument("--points", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    args = parser.parse_args()
+
+    print(f"{'points/tool':>12} {'per-point ms':>14} {'vectorized ms':>14} {'speedup':>8}")
+    for points in args.points:
+        contours = make_contours(args.tools, points, args.width, args.height)
+        assert per_point(contours, args.width, args.height) == vectorized(contours, args.width, args.height)
+        slow = bench(per_point, args.repeat, contours, args.width, args.height)
+        fast = bench(vectorized, args.repeat, contours, args.width, args.height)
+        print(f"{points:>12} {slow * 1000:>14.2f} {fast * 1000:>14.2f} {slow / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
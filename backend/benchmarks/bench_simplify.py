@@ -0,0 +1,59 @@
+"""
+Размер полигонов в ответе и время постобработки при разных simplify_epsilon.
+
+Запуск из папки backend:
+    uv run python -m benchmarks.bench_simplify --eps 0 0.5 1 2 4
+
+Отдельной строкой — худший случай RDP: «пила» из --zigzag точек, где каждое деление отщепляет одну точку.
+"""
+import argparse
+import json
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from aerotools.detection.service import Detector
+from aerotools.utils.geometry import GeometryHelper
+
+from .bench_polygons import make_contours
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tools", type=int, default=11)
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--eps", type=float, nargs="+", default=[0, 0.5, 1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--zigzag", type=int, default=20000)
+    args = parser.parse_args()
+
+    contours = make_contours(args.tools, args.points, args.width, args.height)
+    masks = SimpleNamespace(xy=contours)
+
+    print(f"{'epsilon px':>10} {'vertices':>9} {'payload KB':>11} {'postprocess ms':>15}")
+    for eps in args.eps:
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            polys = Detector._frame_polygons(masks, len(contours), args.width, args.height, eps)
+            payload = json.dumps(polys)
+            best = min(best, time.perf_counter() - start)
+        vertices = sum(len(p) for det in polys for p in det)
+        print(f"{eps:>10} {vertices:>9} {len(payload) / 1024:>11.1f} {best * 1000:>15.2f}")
+
+    # амплитуда растёт — максимум отклонения всегда у края отрезка, RDP делит его по одной точке
+    i = np.arange(args.zigzag, dtype=np.float64)
+    zigzag = np.stack([i, (i % 2) * (1 + i * 1e-3)], axis=1)
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        kept = GeometryHelper.rdp(zigzag, 0.5)
+        best = min(best, time.perf_counter() - start)
+    print(f"zigzag {args.zigzag} points, epsilon 0.5: {len(kept)} vertices, {best * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Вырезание ROI по полигонам: маска на всё изображение (прежняя реализация)
+против маски размером с boundingRect (GeometryHelper.polygon_mask_and_crop).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_mask_crop --width 4000 --height 3000 --tools 11
+"""
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from aerotools.utils.geometry import GeometryHelper
+
+
+def full_frame(np_img: np.ndarray, polygons: list[np.ndarray]) -> list[np.ndarray]:
+    # прежняя реализация: (h, w) маска и bitwise_and по всему кадру на каждый полигон
+    h, w = np_img.shape[:2]
+    rois = []
+    for poly in polygons:
+        if poly is None or len(poly) < 3:
+            continue
+        poly_int = np.round(np.asarray(poly, dtype=np.float32)).astype(np.int32)
+        mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(mask, [poly_int], 255)
+        masked = cv2.bitwise_and(np_img, np_img, mask=mask)
+        x, y, bw, bh = cv2.boundingRect(poly_int)
+        x2, y2 = min(w, x + bw), min(h, y + bh)
+        x, y = max(0, x), max(0, y)
+        roi = masked[y:y2, x:x2]
+        if roi.size > 0:
+            rois.append(roi)
+    return rois
+
+
+def make_polygons(tools: int, w: int, h: int, seed: int = 0) -> list[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    polys = []
+    for _ in range(tools):
+        cx, cy = rng.uniform(0, w), rng.uniform(0, h)
+        t = np.linspace(0, 2 * np.pi, 400, endpoint=False)
+        r = rng.uniform(100, 600) * (1 + 0.3 * np.sin(3 * t))
+        polys.append(np.stack([cx + r * np.cos(t), cy + 0.4 * r * np.sin(t)], axis=1).astype(np.float32))
+    return polys
+
+
+def measure(fn, repeat: int, *args) -> tuple[float, float]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--tools", type=int, default=11)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    np_img = rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+    polygons = make_polygons(args.tools, args.width, args.height)
+
+    old, new = full_frame(np_img, polygons), GeometryHelper.polygon_mask_and_crop(np_img, polygons)
+    assert len(old) == len(new) and all(np.array_equal(a, b) for a, b in zip(old, new))
+
+    print(f"{'impl':>12} {'ms':>9} {'peak alloc MB':>14}")
+    for name, fn in (("full-frame", full_frame), ("bbox-crop", GeometryHelper.polygon_mask_and_crop)):
+        t, peak = measure(fn, args.repeat, np_img, polygons)
+        print(f"{name:>12} {t * 1000:>9.1f} {peak / 2**20:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()